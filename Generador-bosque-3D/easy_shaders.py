@@ -90,6 +90,24 @@ def toGPUShape(shape, wrapMode=None, filterMode=None):
     return gpuShape
 
 
+# Frees the memory used by a shape on the GPU, it can't be drawn afterwards
+def clearGPUShape(gpuShape):
+    glDeleteVertexArrays(1, [gpuShape.vao])
+    glDeleteBuffers(2, [gpuShape.vbo, gpuShape.ebo])
+
+    if gpuShape.texture:
+        glDeleteTextures([gpuShape.texture])
+
+
+# Replaces the indices drawn by a shape on the GPU, its vertices stay as they are
+def setGPUIndices(gpuShape, indices):
+    indices = np.array(indices, dtype=np.uint32)
+
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, gpuShape.ebo)
+    glBufferData(GL_ELEMENT_ARRAY_BUFFER, len(indices) * SIZE_IN_BYTES, indices, GL_STATIC_DRAW)
+    gpuShape.size = len(indices)
+
+
 
 class SimpleShaderProgram:
 
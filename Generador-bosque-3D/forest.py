@@ -10,6 +10,8 @@ import OpenGL.GL.shaders
 import numpy as np
 import sys
 
+from concurrent.futures import ThreadPoolExecutor
+
 import transformations as tr
 import basic_shapes as bs
 import easy_shaders as es
@@ -17,17 +19,37 @@ import scene_graph as sg
 import lighting_shaders as ls
 
 import tree
+import noise
 
 
-# Constants that define the size of the map, from 0 towards a cardinal direction
-# meaning that MAP_X_SIZE = 10 limits the map to x = -10 and x = 10
-MAP_X_SIZE = 4
-MAP_Y_SIZE = 4
+# Returns the value given after a flag in the command line, or a default value
+def getOption(flag, default):
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+# Returns the pair of values of an option written as AxB, or as A for both
+def getPair(flag, default, kind):
+    values = str(getOption(flag, default)).lower().split("x")
+    try:
+        first = kind(values[0])
+        return first, kind(values[1]) if len(values) > 1 else first
+    except ValueError:
+        print("Invalid value for " + flag + ", " + str(default) + " will be used.")
+        return kind(default), kind(default)
 
 
 # Processing the parameters and name given for the .obj model
 # If something isn't provided as it should, the program will try to fix it
-systemArg = sys.argv
+# The parameters are given in order, or by name after them: --gaussians, --seed, --density,
+# --resolution (samples of the terrain, N or NXxNY), --extent (size of the map, S or SXxSY),
+# --height-source (the function that gives the terrain its heights) and --octaves (of fbm)
+systemArg = list(sys.argv)
+for i, arg in enumerate(systemArg):
+    if arg.startswith("--"):
+        systemArg = systemArg[:i]
+        break
 
 fullName = systemArg[1] if len(systemArg) > 1 else "unnamed.obj"
 dotIdx = fullName.find(".")
@@ -43,24 +65,62 @@ if not EXTENSION == ".obj":
     print("Invalid extension, \".obj\" will be used.")
     EXTENSION = ".obj"
 
-preGaussian = systemArg[2] if len(systemArg) > 2 else "7"
+preGaussian = getOption("--gaussians", systemArg[2] if len(systemArg) > 2 else "7")
 GAUSSIAN = int(preGaussian) if preGaussian.isdecimal() else 7
 
 preS = systemArg[3] if len(systemArg) > 3 else "3"
 S = int(preS) if preS.isdecimal() else 3
 
-preRandom = systemArg[4] if len(systemArg) > 4 else "0"
+preRandom = getOption("--seed", systemArg[4] if len(systemArg) > 4 else "0")
 RANDOM = int(preRandom) if preRandom.isdecimal() else 0
 
 preOrder = systemArg[5] if len(systemArg) > 5 else "2"
 ORDER = int(preOrder) if preOrder.isdecimal() else 2
 
-preDensity = systemArg[6] if len(systemArg) > 6 else "1.0"
+preDensity = getOption("--density", systemArg[6] if len(systemArg) > 6 else "1.0")
 try:
     DENSITY = float(preDensity)
 except:
     DENSITY = 1.0
 
+# Constants that define the size of the map, from 0 towards a cardinal direction
+# meaning that MAP_X_SIZE = 10 limits the map to x = -10 and x = 10
+MAP_X_SIZE, MAP_Y_SIZE = getPair("--extent", 4, float)
+
+# Samples of the terrain along x and y, between the limits of the map
+X_SAMPLES, Y_SAMPLES = getPair("--resolution", 40, int)
+
+# Function that gives the heights of the terrain, the gaussians are bumps at random places,
+# the noises are hills of about NOISE_WAVELENGTH over the map, fbm adds OCTAVES noises
+HEIGHT_SOURCES = ["gaussians", "perlin", "simplex", "fbm"]
+HEIGHT_SOURCE = getOption("--height-source", "gaussians")
+if HEIGHT_SOURCE not in HEIGHT_SOURCES:
+    print("Invalid height source, \"gaussians\" will be used.")
+    HEIGHT_SOURCE = "gaussians"
+
+preOctaves = getOption("--octaves", "6")
+OCTAVES = int(preOctaves) if preOctaves.isdecimal() else 6
+
+NOISE_WAVELENGTH = 4
+NOISE_HEIGHT = 0.3
+
+# With --tiles the terrain is split in tiles of TILE_SAMPLES x TILE_SAMPLES samples,
+# consecutive tiles share the samples of their border; the tiles closer than
+# --view-distance to the center of the view are generated in the background
+TILED = "--tiles" in sys.argv
+TILE_SAMPLES = 65
+VIEW_DISTANCE = float(getOption("--view-distance", 20))
+
+# The tiles are drawn with a level of detail that follows their distance to the camera,
+# at level l only one of each 2**l samples is drawn, up to a whole tile as two triangles
+# A level is chosen so the triangles are seen under about LOD_ANGLE radians
+LOD_ANGLE = 0.02
+LOD_LEVELS = int(np.log2(TILE_SAMPLES - 1))
+
+# Distance between the samples the trees were made for, the default map of 40 samples
+# The trees keep their size and spacing over the map at any resolution
+TREE_SPACING = 2 * 4 / 40
+
 COMPLEXITY = 4
 
 
@@ -72,6 +132,8 @@ class Controller:
         self.cameraZoom = 2
         self.cameraPhi = 45
         self.cameraTheta = 45
+        self.centerX = 0
+        self.centerY = 0
 
 
 # Global controller that will communicate with the callback function
@@ -100,6 +162,15 @@ def on_key(window, key, scancode, action, mods):
     elif key == glfw.KEY_W:
         controller.cameraZoom = max(1.0, controller.cameraZoom - 0.1)
 
+    # Moving the center of the view over the map
+    elif key in [glfw.KEY_J, glfw.KEY_L]:
+        sign = 1 if key == glfw.KEY_L else -1
+        controller.centerX = min(max(controller.centerX + sign * 0.1 * controller.cameraZoom, -MAP_X_SIZE), MAP_X_SIZE)
+
+    elif key in [glfw.KEY_I, glfw.KEY_K]:
+        sign = 1 if key == glfw.KEY_I else -1
+        controller.centerY = min(max(controller.centerY + sign * 0.1 * controller.cameraZoom, -MAP_Y_SIZE), MAP_Y_SIZE)
+
     elif action != glfw.PRESS:
         return
     
@@ -123,7 +194,7 @@ def gaussianFunction(x, y, s, sigma, mu):
     return base * np.exp(exponent)
 
 
-# Returns a color affected by altitude (z value)
+# Returns the colors affected by altitude (z values), with a last axis for r, g, b
 def altitudeColor(z):
 
     # Base colors
@@ -131,36 +202,37 @@ def altitudeColor(z):
     yellowGreen = np.array([0.60, 0.80, 0.20])
     forestGreen = np.array([0.13, 0.55, 0.13])
 
-    # Returns a dirtier color below 0
-    if z <= 0:
-        z = min(1, abs(z)) / 1
-        return bronzeii * z + yellowGreen * (1 - z)
-    
-    # Returns a greener color above 0
-    z = min(1, z) / 1
-    return forestGreen * z + yellowGreen * (1 - z)
+    # A dirtier color below 0 and a greener color above 0
+    z = np.asarray(z, dtype=float)[..., np.newaxis]
+    weight = np.minimum(1, np.abs(z))
+    color = np.where(z <= 0, bronzeii, forestGreen)
 
+    return color * weight + yellowGreen * (1 - weight)
 
-# Returns a normal vertex using the z value of surrounding vertices
-def terrainNormal(x, y, zs, i, j):
-    
-    zUp = zs[i - 1, j] if i > 0 else zs[i, j]
-    zDown = zs[i + 1, j] if i < x - 1 else zs[i, j]
-    zLeft = zs[i, j - 1] if j > 0 else zs[i, j]
-    zRight = zs[i, j + 1] if j < y - 1 else zs[i, j]
 
-    # Creating a small plane in order to calculate a normal
-    firstVextex = [4 * MAP_X_SIZE / x, 0, zDown - zUp]
-    secondVextex = [0, 4 * MAP_Y_SIZE / y, zRight - zLeft]
+# Returns the normals of the terrain at every sample, using the z values of the
+# surrounding samples; the samples at the border use themselves as the missing ones
+# samples is the size of the whole terrain, when zs is only a part of it
+def terrainNormal(zs, samples = None):
 
-    # Note that (4 * MAP_X_SIZE / x) represents the horizontal
-    # distance between the 2 z values of interest
+    padded = np.pad(zs, 1, mode="edge")
 
-    return list(np.cross(firstVextex, secondVextex))
+    # Differences along x (down - up) and along y (right - left)
+    dzX = padded[2:, 1:-1] - padded[:-2, 1:-1]
+    dzY = padded[1:-1, 2:] - padded[1:-1, :-2]
+
+    # Each normal is the cross product of a small plane along x and along y:
+    # [dx, 0, dzX] x [0, dy, dzY], where (4 * MAP_X_SIZE / x) represents
+    # the horizontal distance between the 2 z values of interest
+    xSize, ySize = samples if samples is not None else zs.shape
+    dx = 4 * MAP_X_SIZE / xSize
+    dy = 4 * MAP_Y_SIZE / ySize
+
+    return np.stack([-dzX * dy, -dx * dzY, np.full_like(dzX, dx * dy)], axis=-1)
 
 
 # Creates the rules for a tree using randomness
-def treeRule(order = 1):
+def treeRule(order = 1, random = np.random):
 
     rule = "F"
 
@@ -169,85 +241,90 @@ def treeRule(order = 1):
     branch += ["[RDDF[RUUF]F]", "[LUUF[LDDF]F]", "[RF[LUF]F]", "[LF[RDF]F]"]
 
     for _ in range(max(1, COMPLEXITY - order * 2)):
-        randint = int(np.random.randint(0, len(branch)))
+        randint = int(random.randint(0, len(branch)))
         rule += branch[randint] + "F"
 
     return rule
 
 
-# Creates a forest with happy little trees to be put above a terrain
-# Order was considered as a parameter, but it was replaced by complexity due to his cost
-def plantTrees(zMap, density = 1, order = 1):
+# Chooses where to plant happy little trees over the samples zMap of the terrain,
+# returns the parameters and position of each tree
+# first is the sample i, j of the whole terrain where zMap starts; the trees only depend
+# on random, RANDOM and their samples, so the same samples always get the same trees
+def chooseTrees(zMap, normals, density = 1, first = (0, 0), random = np.random):
 
-    # Graph that will contain all the trees
-    forestGraph = sg.SceneGraphNode("forest")
+    trees = []
 
-    xSize = zMap.shape[0]
-    ySize = zMap.shape[1]
+    dx = 2 * MAP_X_SIZE / X_SAMPLES
+    dy = 2 * MAP_Y_SIZE / Y_SAMPLES
 
-    dx = 2 * MAP_X_SIZE / xSize
-    dy = 2 * MAP_Y_SIZE / ySize
+    # Choosing where to plant trees, the chance of each sample follows its area
+    # so the number of trees over the map doesn't change with the resolution
+    scale = (dx * dy) / TREE_SPACING**2
+    treeCoordinates = random.randint(0, max(1, 40 / density / scale), zMap.shape)
 
-    x = -MAP_X_SIZE + dx / 2
+    # Plants a tree in a (x, y, z) position, only the chosen samples are visited,
+    # in order, as each tree takes the samples around it
+    for i, j in zip(*np.nonzero(treeCoordinates == 0)):
 
-    # Choosing where to plant trees
-    treeCoordinates = np.random.randint(0, 40 / density, zMap.shape)
+        if treeCoordinates[i, j] != 0:
+            continue
 
-    # Plants a tree in a (x, y, z) position
-    for i in range(zMap.shape[0]):
+        # Sample of the whole terrain
+        I = first[0] + i
+        J = first[1] + j
 
-        y = -MAP_Y_SIZE + dy / 2
+        x = -MAP_X_SIZE + dx / 2 + I * dx
+        y = -MAP_Y_SIZE + dy / 2 + J * dy
 
-        for j in range(zMap.shape[1]):
+        # Burying the tree a little to ensure it isn't floating
+        normal = normals[i, j]
+        correction = (abs(normal[0]) + abs(normal[1])) / 5
 
-            if treeCoordinates[i, j] == 0:
+        # Randomizing the order, size and skip parameters
+        treeRandom = np.random.RandomState((RANDOM + I * J) % 2**32)
+        variance = treeRandom.uniform()
+        realOrder = max(1, ORDER - int(variance > 0.4))
+        realSize = tree.SIZE + 0.4 * int(variance > 0.6) + 0.2 * int(variance > 0.8)
+        realSize += (realOrder - 1) * 0.5
+        realSkip = treeRandom.randint(0, realOrder**2 + 1)
 
-                # Burying the tree a little to ensure it isn't floating
-                normal = terrainNormal(xSize, ySize, zMap, i, j)
-                correction = (abs(normal[0]) + abs(normal[1])) / 5
-                
-                # Randomizing the order, size and skip parameters
-                np.random.seed(RANDOM + i * j)
-                variance = np.random.uniform()
-                realOrder = max(1, ORDER - int(variance > 0.4))
-                realSize = tree.SIZE + 0.4 * int(variance > 0.6) + 0.2 * int(variance > 0.8)
-                realSize += (realOrder - 1) * 0.5
-                realSkip = np.random.randint(0, realOrder**2 + 1)
+        # Randomizing the rule of creation
+        realRule = treeRule(realOrder, treeRandom)
 
-                # Randomizing the rule of creation
-                realRule = treeRule(realOrder)
+        # Trees can't be planted close to each other, the distance is kept over the map
+        span = realSize + realOrder
+        treeCoordinates[i:i + int(span * (TREE_SPACING / dx)), j:j + int(span * (TREE_SPACING / dy))] = 1
 
-                # Trees can't be planted close to each other
-                for k in range(i, i + int(realSize + realOrder)):
-                    for l in range(j, j + int(realSize + realOrder)):
-                        try:
-                            treeCoordinates[k, l] = 1
-                        except:
-                            pass
+        trees += [(realRule, realOrder, realSize, realSkip, [x, y, zMap[i, j] - correction])]
 
-                treeGraph = tree.createTree(realRule, realOrder, realSize, realSkip)
-                treeGraph.transform = tr.translate(x, y, zMap[i, j] - correction)
+    return trees
 
-                forestGraph.childs += [treeGraph]
-            
-            y += dy
-        x += dx
 
-    return forestGraph
+# Creates the trees chosen by chooseTrees, in a graph
+def createTrees(trees):
 
+    # Graph that will contain all the trees
+    forestGraph = sg.SceneGraphNode("forest")
 
-# Generates terrain using gaussian functions
-def generateTerrain(xs, ys, s):
+    for rule, order, size, skip, position in trees:
+        treeGraph = tree.createTree(rule, order, size, skip)
+        treeGraph.transform = tr.translate(*position)
 
-    verticesList = []
+        forestGraph.childs += [treeGraph]
 
-    vertices = []
-    indices = []
+    return forestGraph
 
-    xSize = len(xs)
-    ySize = len(ys)
 
-    zs = np.zeros((xSize, ySize))
+# Creates a forest with happy little trees to be put above a terrain
+# Order was considered as a parameter, but it was replaced by complexity due to his cost
+def plantTrees(zMap, density = 1, order = 1):
+    return createTrees(chooseTrees(zMap, terrainNormal(zMap), density, (0, 0), np.random.RandomState(RANDOM)))
+
+
+# Randomizes the gaussian functions of the terrain, each one from its own seed,
+# returns their centers mu (GAUSSIAN x 2), sigmas and signs
+def gaussianParameters(s):
 
     muList = []
     sigmaList = []
@@ -256,61 +333,341 @@ def generateTerrain(xs, ys, s):
     # Each gaussian function is randomized
     for i in range(GAUSSIAN):
 
-        np.random.seed(RANDOM + i)
-        random = 2 * np.random.uniform(0, 1.0, 2) - 1.0
-        random[0] *= MAP_X_SIZE
-        random[1] *= MAP_Y_SIZE
+        random = np.random.RandomState(RANDOM + i)
+        mu = 2 * random.uniform(0, 1.0, 2) - 1.0
+        mu[0] *= MAP_X_SIZE
+        mu[1] *= MAP_Y_SIZE
 
-        muList += [np.copy(random)]
-        
-        sigmaList += [max(1, s - np.random.uniform())]
-        signList += [1] if np.random.uniform() > 0.3 else [-1]
+        muList += [mu]
 
-    # Generating a vertex for each sample x, y, z, using a
-    # number of gaussian functions defined as a parameter
-    for i in range(xSize):
-        for j in range(ySize):
-            x = xs[i]
-            y = ys[j]
-            z = 0
+        sigmaList += [max(1, s - random.uniform())]
+        signList += [1] if random.uniform() > 0.3 else [-1]
 
-            for sigma, mu, sign in zip(sigmaList, muList, signList):
-                z += gaussianFunction(x, y, s, sigma, mu) * sign
+    return np.array(muList).reshape(-1, 2), np.array(sigmaList), np.array(signList)
 
-            zs[i, j] = z
 
-            verticesList += [[x, y, z] + list(altitudeColor(z))]
-    
-    # Generating the normal vertices
-    for i in range(xSize):
-        for j in range(ySize):
-            normal = terrainNormal(xSize, ySize, zs, i, j)
+# Returns the z value of each sample X, Y as the sum of the gaussian functions,
+# evaluated over an array GAUSSIAN x X.shape
+def gaussianHeight(X, Y, s):
 
-            verticesList[i * xSize + j] += normal
+    mu, sigma, sign = gaussianParameters(s)
+    mu = mu.reshape((-1, 2) + (1,) * X.ndim)
+    sigma = sigma.reshape((-1,) + (1,) * X.ndim)
+    sign = sign.reshape((-1,) + (1,) * X.ndim)
+
+    return np.sum(gaussianFunction(X, Y, s, sigma, (mu[:, 0], mu[:, 1])) * sign, axis=0)
+
+
+# Returns the z value of each sample X, Y from a noise seeded by RANDOM, s scales the heights
+def noiseHeight(X, Y, s):
+
+    x = X / NOISE_WAVELENGTH
+    y = Y / NOISE_WAVELENGTH
+
+    if HEIGHT_SOURCE == "fbm":
+        z = noise.fbm(x, y, RANDOM, OCTAVES)
+    else:
+        z = noise.NOISES[HEIGHT_SOURCE](x, y, RANDOM)
+
+    return s * NOISE_HEIGHT * z
+
+
+# Returns the z value of each sample xs x ys from the height source chosen, all of them
+# at once; a source only depends on the positions and RANDOM, so a tile gets the same
+# heights as the whole terrain
+def terrainHeight(xs, ys, s):
+
+    X, Y = np.meshgrid(xs, ys, indexing="ij")
+
+    if HEIGHT_SOURCE == "gaussians":
+        return gaussianHeight(X, Y, s)
+    return noiseHeight(X, Y, s)
+
+
+# Shape of the terrain over the samples xs, ys, with their z values and normals
+def terrainShape(xs, ys, zs, normals):
+
+    xSize = len(xs)
+    ySize = len(ys)
+
+    # Each vertex has a position x, y, z, a color and a normal
+    X, Y = np.meshgrid(xs, ys, indexing="ij")
+
+    vertices = np.zeros((xSize, ySize, 9))
+    vertices[:, :, 0] = X
+    vertices[:, :, 1] = Y
+    vertices[:, :, 2] = zs
+    vertices[:, :, 3:6] = altitudeColor(zs)
+    vertices[:, :, 6:9] = normals
+
+    # The vertices are generated by full columns j-y and then move to
+    # the next i-x. Hence, the index for each vertex i,j is i * ySize + j
+    index = np.arange(xSize * ySize).reshape(xSize, ySize)
 
-            vertices += verticesList[i * xSize + j]
-    
-    # The previous loops generates full columns j-y and then move to
-    # the next i-x. Hence, the index for each vertex i,j can be computed as
-    index = lambda i, j: i*len(ys) + j 
-    
     # We generate quads for each cell connecting 4 neighbor vertices
-    for i in range(len(xs)-1):
-        for j in range(len(ys)-1):
+    isw = index[:-1, :-1]
+    ise = index[1:, :-1]
+    ine = index[1:, 1:]
+    inw = index[:-1, 1:]
+
+    # Adding each cell's quad as 2 triangles
+    indices = np.stack([isw, ise, ine, ine, inw, isw], axis=-1)
+
+    return bs.Shape(vertices.ravel(), indices.ravel())
+
+
+# Generates terrain using gaussian functions, all the samples are computed at once
+def generateTerrain(xs, ys, s):
+
+    xs = np.ravel(xs)
+    ys = np.ravel(ys)
+
+    zs = terrainHeight(xs, ys, s)
+
+    return terrainShape(xs, ys, zs, terrainNormal(zs)), zs
+
+
+# Positions of the samples start to end (not included) of an axis of the map,
+# the same values np.linspace(-size, size, samples) has, without computing the rest
+def samplePositions(start, end, samples, size):
+    positions = -size + np.arange(start, end) * (2 * size / (samples - 1))
+    if end == samples:
+        positions[-1] = size
+    return positions
+
+
+# Number of tiles along an axis of samples, consecutive tiles share a sample
+def tileCount(samples):
+    return max(1, -(-(samples - 1) // (TILE_SAMPLES - 1)))
+
+
+# Samples of the whole terrain covered by the tile number t along an axis, [start, end)
+def tileRange(t, samples):
+    start = t * (TILE_SAMPLES - 1)
+    return start, min(start + TILE_SAMPLES, samples)
+
+
+# Generates the tile ti, tj of the terrain: its shape and the trees chosen over it,
+# without using the GPU, so tiles can be generated by other threads
+# A tile is the same part of the terrain generateTerrain gives for the whole map
+def generateTile(ti, tj, s):
+
+    (i0, i1), (j0, j1) = tileRange(ti, X_SAMPLES), tileRange(tj, Y_SAMPLES)
+
+    # The tile is computed with the samples around it, where the map has them,
+    # so the normals of its border are the same in the neighbor tiles
+    a0, a1 = max(i0 - 1, 0), min(i1 + 1, X_SAMPLES)
+    b0, b1 = max(j0 - 1, 0), min(j1 + 1, Y_SAMPLES)
 
-            # Getting indices for all vertices in this quad
-            isw = index(i,j)
-            ise = index(i+1,j)
-            ine = index(i+1,j+1)
-            inw = index(i,j+1)
+    xs = samplePositions(a0, a1, X_SAMPLES, MAP_X_SIZE)
+    ys = samplePositions(b0, b1, Y_SAMPLES, MAP_Y_SIZE)
 
-            # Adding this cell's quad as 2 triangles
-            indices += [
-                isw, ise, ine,
-                ine, inw, isw
-            ]
+    zs = terrainHeight(xs, ys, s)
+    normals = terrainNormal(zs, (X_SAMPLES, Y_SAMPLES))
 
-    return bs.Shape(vertices, indices), zs
+    tile = (slice(i0 - a0, i1 - a0), slice(j0 - b0, j1 - b0))
+    shape = terrainShape(xs[tile[0]], ys[tile[1]], zs[tile], normals[tile])
+
+    # The trees are planted over the samples of the tile without its last border,
+    # that belongs to the next tile, unless there is none
+    own = (slice(i0 - a0, i1 - a0 - (i1 < X_SAMPLES)), slice(j0 - b0, j1 - b0 - (j1 < Y_SAMPLES)))
+    trees = chooseTrees(zs[own], normals[own], DENSITY, (i0, j0), np.random.RandomState([RANDOM, ti, tj]))
+
+    return shape, trees
+
+
+# Positions kept along an axis of n samples drawn every step samples, the last one is always kept
+def lodPositions(n, step):
+    return np.unique(np.append(np.arange(0, n, step), n - 1))
+
+
+# Indices of a tile of xSize x ySize samples drawn every step samples, as terrainShape
+# orders its vertices; edges are the steps of the neighbor tiles at the west, east, south
+# and north. Along an edge with a coarser neighbor the vertices snap to the previous vertex
+# of the neighbor, so both tiles draw the same edge and there are no cracks between them,
+# the triangles that lose their area are left out
+def lodIndices(xSize, ySize, step, edges):
+
+    I = lodPositions(xSize, step)
+    J = lodPositions(ySize, step)
+    II, JJ = np.meshgrid(I, J, indexing="ij")
+
+    # Previous position of each one that is also kept at a coarser step
+    def snap(positions, n, coarse):
+        kept = lodPositions(n, coarse)
+        return kept[np.searchsorted(kept, positions, side="right") - 1]
+
+    west, east, south, north = edges
+    if west > step:
+        JJ[0, :] = snap(J, ySize, west)
+    if east > step:
+        JJ[-1, :] = snap(J, ySize, east)
+    if south > step:
+        II[:, 0] = snap(I, xSize, south)
+    if north > step:
+        II[:, -1] = snap(I, xSize, north)
+
+    index = II * ySize + JJ
+
+    isw = index[:-1, :-1]
+    ise = index[1:, :-1]
+    ine = index[1:, 1:]
+    inw = index[:-1, 1:]
+
+    triangles = np.stack([isw, ise, ine, ine, inw, isw], axis=-1).reshape(-1, 3)
+    degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | \
+                 (triangles[:, 2] == triangles[:, 0])
+
+    return triangles[~degenerate].ravel()
+
+
+# Frees the GPU memory of the shapes in a graph
+def clearGraph(graph):
+    if type(graph) is es.GPUShape:
+        es.clearGPUShape(graph)
+        return
+
+    for child in graph.childs:
+        clearGraph(child)
+
+
+# Terrain split in tiles, they are generated in the background by a pool of threads and
+# moved to the GPU once they are ready; only the tiles around the center of the view are
+# kept, as any tile can be generated again from RANDOM and its coordinates
+# Every tile keeps all its vertices on the GPU, only the indices drawn change with its level
+class TerrainTiles:
+
+    # Tiles moved to the GPU in a frame, so the frames stay smooth
+    TILES_PER_FRAME = 2
+
+    def __init__(self, s, workers = None):
+        self.s = s
+        self.tilesShape = (tileCount(X_SAMPLES), tileCount(Y_SAMPLES))
+
+        # Size of a tile over the map
+        self.tileWidth = 2 * MAP_X_SIZE / (X_SAMPLES - 1) * (TILE_SAMPLES - 1)
+        self.tileHeight = 2 * MAP_Y_SIZE / (Y_SAMPLES - 1) * (TILE_SAMPLES - 1)
+
+        # Distance between the samples, the triangles of level 0
+        self.spacing = min(2 * MAP_X_SIZE / (X_SAMPLES - 1), 2 * MAP_Y_SIZE / (Y_SAMPLES - 1))
+
+        self.pool = ThreadPoolExecutor(workers)
+        self.pending = {}
+        self.tiles = {}
+
+        # Terrain of each tile on the GPU, its samples and the level it is drawn with,
+        # the indices of each level are shared by the tiles of the same samples
+        self.shapes = {}
+        self.sizes = {}
+        self.lods = {}
+        self.indices = {}
+        self.triangles = 0
+
+        # Camera the levels were chosen for, None once the tiles change
+        self.chosenFor = None
+
+        self.graph = sg.SceneGraphNode("terrain")
+
+    # Distance over the map from x, y to the closest point of the tiles ti, tj
+    def distance(self, ti, tj, x, y):
+        x0 = -MAP_X_SIZE + ti * self.tileWidth
+        y0 = -MAP_Y_SIZE + tj * self.tileHeight
+        dx = np.maximum(0, np.maximum(x0 - x, x - x0 - self.tileWidth))
+        dy = np.maximum(0, np.maximum(y0 - y, y - y0 - self.tileHeight))
+        return np.sqrt(dx**2 + dy**2)
+
+    # Tiles with a part closer than distance to x, y, from the closest one
+    def around(self, x, y, distance):
+        nx, ny = self.tilesShape
+
+        tis = np.arange(max(0, int((x - distance + MAP_X_SIZE) // self.tileWidth)),
+                        min(nx, int((x + distance + MAP_X_SIZE) // self.tileWidth) + 1))
+        tjs = np.arange(max(0, int((y - distance + MAP_Y_SIZE) // self.tileHeight)),
+                        min(ny, int((y + distance + MAP_Y_SIZE) // self.tileHeight) + 1))
+        TI, TJ = np.meshgrid(tis, tjs, indexing="ij")
+        tileDistance = self.distance(TI, TJ, x, y)
+
+        close = tileDistance < distance
+        order = np.argsort(tileDistance[close], kind="stable")
+        return [(int(ti), int(tj)) for ti, tj in zip(TI[close][order], TJ[close][order])]
+
+    # Asks for the tiles around x, y, moves the ready ones to the GPU,
+    # and frees the ones that are too far
+    def update(self, x, y, distance):
+        for key in self.around(x, y, distance):
+            if key not in self.tiles and key not in self.pending:
+                self.pending[key] = self.pool.submit(generateTile, key[0], key[1], self.s)
+
+        # The tiles only leave beyond a longer distance, so they don't come and go
+        keep = set(self.around(x, y, 1.5 * distance))
+
+        ready = [key for key, future in self.pending.items() if future.done()]
+        for key in ready[:self.TILES_PER_FRAME]:
+            shape, trees = self.pending.pop(key).result()
+            if key not in keep:
+                continue
+
+            (i0, i1), (j0, j1) = tileRange(key[0], X_SAMPLES), tileRange(key[1], Y_SAMPLES)
+            self.shapes[key] = es.toGPUShape(shape)
+            self.sizes[key] = (i1 - i0, j1 - j0)
+
+            terrainGraph = sg.SceneGraphNode("tile terrain")
+            terrainGraph.childs += [self.shapes[key]]
+
+            tileGraph = sg.SceneGraphNode("tile")
+            tileGraph.childs += [terrainGraph, createTrees(trees)]
+            self.tiles[key] = tileGraph
+            self.chosenFor = None
+
+        for key in list(self.tiles):
+            if key not in keep:
+                clearGraph(self.tiles.pop(key))
+                del self.shapes[key], self.sizes[key]
+                self.lods.pop(key, None)
+                self.chosenFor = None
+
+        for key in list(self.pending):
+            if key not in keep and self.pending[key].cancel():
+                del self.pending[key]
+
+        self.graph.childs = list(self.tiles.values())
+
+    # Chooses the level of each tile from its distance to the camera at viewPos, the
+    # triangles drawn stay about the same at any resolution, as the farther tiles are
+    # drawn with fewer samples; the indices of a tile only change with its level or
+    # the level of its neighbors
+    def chooseLevels(self, viewPos):
+        if self.chosenFor is not None and np.array_equal(self.chosenFor, viewPos):
+            return
+
+        self.chosenFor = np.array(viewPos)
+        self.triangles = 0
+        if not self.tiles:
+            return
+
+        keys = list(self.tiles)
+        ti, tj = np.array(keys).T
+        distance = np.sqrt(self.distance(ti, tj, viewPos[0], viewPos[1])**2 + viewPos[2]**2)
+
+        levels = np.floor(np.log2(np.maximum(LOD_ANGLE * distance / self.spacing, 1)))
+        levels = dict(zip(keys, np.clip(levels, 0, LOD_LEVELS).astype(int)))
+
+        for key, level in levels.items():
+            ti, tj = key
+            step = 2**level
+
+            # Only the finer side of an edge adapts to the other
+            neighbors = [(ti - 1, tj), (ti + 1, tj), (ti, tj - 1), (ti, tj + 1)]
+            edges = tuple(max(step, 2**levels.get(neighbor, level)) for neighbor in neighbors)
+
+            lod = self.sizes[key] + (step, edges)
+            if self.lods.get(key) != lod:
+                if lod not in self.indices:
+                    self.indices[lod] = lodIndices(*lod)
+                es.setGPUIndices(self.shapes[key], self.indices[lod])
+                self.lods[key] = lod
+
+            self.triangles += self.shapes[key].size // 3
 
 
 # Moves the camera around a sphere looking at the center,
@@ -324,9 +681,9 @@ def moveCamera():
     # Zoom level of the camera, how far is from the center
     zoom = controller.cameraZoom
 
-    # Camera position in cartesian coordinates
-    camX = zoom * np.sin(phi) * np.cos(theta)
-    camY = zoom * np.sin(phi) * np.sin(theta)
+    # Camera position in cartesian coordinates, around the center of the view
+    camX = controller.centerX + zoom * np.sin(phi) * np.cos(theta)
+    camY = controller.centerY + zoom * np.sin(phi) * np.sin(theta)
     camZ = zoom * np.cos(phi)
 
     # Phi direction in cartesian coordinates
@@ -337,7 +694,7 @@ def moveCamera():
     viewPos = np.array([camX, camY, camZ])
     viewUp = np.array([upX, upY, upZ])
 
-    return tr.lookAt(viewPos, np.array([0, 0, 0.4]), viewUp), viewPos
+    return tr.lookAt(viewPos, np.array([controller.centerX, controller.centerY, 0.4]), viewUp), viewPos
 
 
 # Exports a given forest to .obj, using the documentation in formats.pdf
@@ -402,21 +759,27 @@ if __name__ == "__main__":
     # Creating shapes on GPU memory
     gpuAxis = es.toGPUShape(bs.createAxis())
 
-    # Generate a terrain with 80 samples between the limits of the map
-    xs = np.ogrid[-MAP_X_SIZE:MAP_X_SIZE:40j]
-    ys = np.ogrid[-MAP_Y_SIZE:MAP_Y_SIZE:40j]
+    # Creating the scene graph, a tiled terrain is never whole, so it isn't exported
+    forestGraph = sg.SceneGraphNode("forest")
 
-    terrainShape, zs = generateTerrain(xs, ys, S)
+    if TILED:
+        terrainTiles = TerrainTiles(S)
+        forestGraph.childs += [terrainTiles.graph]
 
-    # Creating the scene graph
-    terrainGraph = sg.SceneGraphNode("terrain")
-    terrainGraph.childs += [es.toGPUShape(terrainShape)]
+    else:
+        # Generate a terrain with the samples given between the limits of the map
+        xs = samplePositions(0, X_SAMPLES, X_SAMPLES, MAP_X_SIZE)
+        ys = samplePositions(0, Y_SAMPLES, Y_SAMPLES, MAP_Y_SIZE)
 
-    forestGraph = sg.SceneGraphNode("forest")
-    forestGraph.childs += [terrainGraph, plantTrees(zs, DENSITY, 1)]
+        terrain, zs = generateTerrain(xs, ys, S)
+
+        terrainGraph = sg.SceneGraphNode("terrain")
+        terrainGraph.childs += [es.toGPUShape(terrain)]
+
+        forestGraph.childs += [terrainGraph, plantTrees(zs, DENSITY, 1)]
 
-    if EXTENSION == ".obj":
-        exportForest(forestGraph)
+        if EXTENSION == ".obj":
+            exportForest(forestGraph)
 
     # Setting up the projection
     projection = tr.perspective(45, float(width)/float(height), 0.1, 100)
@@ -426,9 +789,14 @@ if __name__ == "__main__":
         # Using GLFW to check for input events
         glfw.poll_events()
 
-        # Moving the camera
+        # Moving the camera, the tiles around the center of the view are generated
+        # and drawn with less detail the farther they are from it
         view, viewPos = moveCamera()
 
+        if TILED:
+            terrainTiles.update(controller.centerX, controller.centerY, VIEW_DISTANCE + controller.cameraZoom)
+            terrainTiles.chooseLevels(viewPos)
+
         # Clearing the screen in both, color and depth
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
@@ -474,4 +842,7 @@ if __name__ == "__main__":
         # Once the drawing is rendered, buffers are swap so an uncomplete drawing is never seen.
         glfw.swap_buffers(window)
 
+    if TILED:
+        terrainTiles.pool.shutdown(cancel_futures=True)
+
     glfw.terminate()
\ No newline at end of file
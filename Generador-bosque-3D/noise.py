@@ -0,0 +1,124 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Gradient noise (Perlin and simplex) and fractal brownian motion over it,
+evaluated over whole arrays of points at once
+"""
+
+import numpy as np
+
+
+# Directions of the gradients at the corners of the grid, picked by a hash
+GRADIENTS = np.array([[np.cos(a), np.sin(a)] for a in np.arange(8) * np.pi / 4 + np.pi / 8])
+
+# Factors to skew the square grid into the triangles of simplex noise, and back
+SKEW = (np.sqrt(3) - 1) / 2
+UNSKEW = (3 - np.sqrt(3)) / 6
+
+
+# Mixes the bits of an array of unsigned 64-bit integers (the finalizer of splitmix64),
+# each bit of the result depends on all the bits of x
+def mix(x):
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+# Gradient of each corner i, j of the grid (integer arrays), from a hash of the corner and
+# the seed, so the noise has no period and any part of it can be evaluated by itself
+# Each coordinate is mixed before the next one joins, so that corners such as i, j and
+# -i, -j don't end up with related hashes
+def cornerGradient(i, j, seed):
+    h = mix(mix(i.astype(np.uint64) ^ np.uint64(seed)) ^ j.astype(np.uint64))
+    return GRADIENTS[(h & np.uint64(7)).astype(int)]
+
+
+# Contribution of the corners i, j at the offsets x, y from them, the dot product
+# of their gradient with the offset
+def cornerValue(i, j, x, y, seed):
+    gradient = cornerGradient(i, j, seed)
+    return gradient[..., 0] * x + gradient[..., 1] * y
+
+
+# Perlin noise at the points x, y, between about -1 and 1 with features of size 1
+def perlin(x, y, seed = 0):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    i = np.floor(x).astype(np.int64)
+    j = np.floor(y).astype(np.int64)
+    u = x - i
+    v = y - j
+
+    # The corners of the cell are blended with a curve of zero slope at its ends
+    fadeU = u**3 * (u * (u * 6 - 15) + 10)
+    fadeV = v**3 * (v * (v * 6 - 15) + 10)
+
+    sw = cornerValue(i, j, u, v, seed)
+    se = cornerValue(i + 1, j, u - 1, v, seed)
+    nw = cornerValue(i, j + 1, u, v - 1, seed)
+    ne = cornerValue(i + 1, j + 1, u - 1, v - 1, seed)
+
+    south = sw + fadeU * (se - sw)
+    north = nw + fadeU * (ne - nw)
+
+    return np.sqrt(2) * (south + fadeV * (north - south))
+
+
+# Simplex noise at the points x, y, between about -1 and 1 with features of size 1
+# Each point only adds the 3 corners of its triangle, instead of the 4 of a square
+def simplex(x, y, seed = 0):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Triangle of each point, in the skewed grid
+    skew = (x + y) * SKEW
+    i = np.floor(x + skew).astype(np.int64)
+    j = np.floor(y + skew).astype(np.int64)
+
+    unskew = (i + j) * UNSKEW
+    x0 = x - (i - unskew)
+    y0 = y - (j - unskew)
+
+    # The middle corner is along x or along y, depending on the half of the cell
+    alongX = (x0 > y0).astype(np.int64)
+    alongY = 1 - alongX
+
+    corners = [(i, j, x0, y0),
+               (i + alongX, j + alongY, x0 - alongX + UNSKEW, y0 - alongY + UNSKEW),
+               (i + 1, j + 1, x0 - 1 + 2 * UNSKEW, y0 - 1 + 2 * UNSKEW)]
+
+    total = np.zeros_like(x)
+    for ci, cj, cx, cy in corners:
+        weight = np.maximum(0, 0.5 - cx**2 - cy**2)
+        total += weight**4 * cornerValue(ci, cj, cx, cy, seed)
+
+    # The usual scale of simplex noise is for gradients of length sqrt(2)
+    return 70 * np.sqrt(2) * total
+
+
+# Noises by their name, any of them can be the base of fbm
+NOISES = {"perlin": perlin, "simplex": simplex}
+
+
+# Fractal brownian motion: octaves of a noise, each one with features lacunarity times
+# smaller and gain times lower than the previous one, with a seed of its own
+# The result is normalized, so it stays between about -1 and 1
+def fbm(x, y, seed = 0, octaves = 6, lacunarity = 2.0, gain = 0.5, noise = perlin):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    total = np.zeros_like(x)
+    frequency = 1.0
+    amplitude = 1.0
+    amplitudes = 0.0
+
+    for octave in range(octaves):
+        total += amplitude * noise(x * frequency, y * frequency, seed + octave)
+        amplitudes += amplitude
+        frequency *= lacunarity
+        amplitude *= gain
+
+    return total / amplitudes
@@ -0,0 +1,36 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Tests of the gradient noises of noise.py, run with pytest
+"""
+
+import numpy as np
+import pytest
+
+import noise
+
+
+# Samples of a square of the map centered at 0
+x = np.linspace(-40, 40, 401)
+X, Y = np.meshgrid(x, x, indexing="ij")
+
+
+# The noise at -x, -y has nothing to do with the noise at x, y
+@pytest.mark.parametrize("name", ["perlin", "simplex", "fbm"])
+@pytest.mark.parametrize("seed", [0, 1, 7, 123])
+def test_noise_has_no_point_symmetry(name, seed):
+    function = noise.fbm if name == "fbm" else noise.NOISES[name]
+    z = function(X, Y, seed)
+
+    correlation = np.corrcoef(z.ravel(), z[::-1, ::-1].ravel())[0, 1]
+    assert abs(correlation) < 0.1
+
+
+# The same seed gives the same noise, another seed a different one
+@pytest.mark.parametrize("name", ["perlin", "simplex"])
+def test_noise_depends_on_seed(name):
+    z = noise.NOISES[name](X, Y, 3)
+
+    assert np.array_equal(z, noise.NOISES[name](X, Y, 3))
+    assert not np.allclose(z, noise.NOISES[name](X, Y, 4))
+    assert np.abs(z).max() <= 1.1
@@ -0,0 +1,178 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Arrow map of the gradient of a solution, precomputed at several levels of detail
+and split in tiles, so only the visible tiles are drawn at a level that fits their distance
+"""
+
+import numpy as np
+
+import basic_shapes as bs
+
+
+# Points of the finest level along each side of a tile
+TILE = 32
+
+# The arrows chosen are at least this angle apart as seen from the camera, in radians
+MIN_ARROW_ANGLE = 0.02
+
+# Length of an arrow of magnitude 1, and width of its head, at the finest level
+ARROW_LENGTH = 0.07
+ARROW_WIDTH = 0.02
+
+# Height of the arrows over the floor
+ARROW_HEIGHT = 0.05
+
+
+# Derivatives of a solution along x and y at every point, indexed by i,j;
+# the border points use themselves as the missing neighbor
+def gradientField(solution, h):
+    z = np.pad(np.asarray(solution, dtype=float), 1, mode="edge")
+
+    # Calculating the derivatives by approximation
+    x = (z[2:, 1:-1] - z[:-2, 1:-1]) / (2 * h)
+    y = (z[1:-1, 2:] - z[1:-1, :-2]) / (2 * h)
+
+    return x, y
+
+
+# Direction (normalized) and magnitude (up to 1) of the derivatives x, y,
+# the points without a gradient have no direction
+def directions(x, y):
+    norm = np.sqrt(x**2 + y**2)
+    safeNorm = np.where(norm > 0, norm, 1)
+
+    return np.stack([x / safeNorm, y / safeNorm], axis=-1), np.minimum(1, norm)
+
+
+# Vertices of the arrows that start at the positions (n x 2), each one has 4 black vertices:
+# its start, its end, and the two corners of its head
+def arrowVertices(positions, gradient, magnitude, scale=1.0):
+    count = len(positions)
+    magnitude = magnitude.reshape(-1, 1)
+
+    vertex = np.zeros((count, 3))
+    vertex[:, :2] = positions
+    vertex[:, 2] = ARROW_HEIGHT
+
+    end_point = vertex.copy()
+    end_point[:, :2] += scale * ARROW_LENGTH * magnitude * gradient
+
+    middle = (vertex + end_point) / 2
+
+    # Creating the arrowhead, perpendicular to the gradient over the floor
+    perpendicular = np.zeros((count, 3))
+    perpendicular[:, 0] = gradient[:, 1]
+    perpendicular[:, 1] = -gradient[:, 0]
+
+    vertices = np.zeros((count, 4, 6), dtype=np.float32)
+    vertices[:, 0, :3] = vertex
+    vertices[:, 1, :3] = end_point
+    vertices[:, 2, :3] = middle + scale * ARROW_WIDTH * magnitude * perpendicular
+    vertices[:, 3, :3] = middle - scale * ARROW_WIDTH * magnitude * perpendicular
+
+    return vertices
+
+
+# Indices of count arrows, meant to be drawn with GL_LINES, 6 per arrow
+def arrowIndices(count):
+    first = 4 * np.arange(count, dtype=np.uint32)[:, np.newaxis]
+    return (first + np.array([0, 1, 1, 2, 1, 3], dtype=np.uint32)).ravel()
+
+
+# Arrow map at several levels of detail, as a mipmap pyramid of the gradient
+class ArrowPyramid:
+
+    # The level l has an arrow at the middle of each block of 2^l x 2^l points, with their
+    # mean gradient, and longer by 2^l; the levels stop when a block covers the solution
+    # The arrows of each level are sorted by tile, so a tile is a range of indices
+    def __init__(self, solution, h):
+        x, y = gradientField(solution, h)
+        nh, nv = x.shape
+        self.h = h
+
+        self.tilesShape = (-(-nh // TILE), -(-nv // TILE))
+        tileCount = self.tilesShape[0] * self.tilesShape[1]
+
+        # Limits of each tile over the floor, [x min, y min, x max, y max]
+        TI, TJ = np.meshgrid(np.arange(self.tilesShape[0]), np.arange(self.tilesShape[1]), indexing="ij")
+        self.bounds = np.stack([
+            TI.ravel() * TILE * h, TJ.ravel() * TILE * h,
+            np.minimum((TI.ravel() + 1) * TILE, nh - 1) * h, np.minimum((TJ.ravel() + 1) * TILE, nv - 1) * h],
+            axis=-1)
+
+        self.shapes = []
+        self.starts = []
+        self.counts = []
+
+        block = 1
+        while True:
+            starts = [np.arange(0, nh, block), np.arange(0, nv, block)]
+            sizes = [np.diff(np.append(start, n)) for start, n in zip(starts, [nh, nv])]
+
+            # Mean of the derivatives over each block
+            area = np.outer(sizes[0], sizes[1])
+            meanX = np.add.reduceat(np.add.reduceat(x, starts[0], axis=0), starts[1], axis=1) / area
+            meanY = np.add.reduceat(np.add.reduceat(y, starts[0], axis=0), starts[1], axis=1) / area
+
+            BI, BJ = np.meshgrid(starts[0], starts[1], indexing="ij")
+            SI, SJ = np.meshgrid(sizes[0], sizes[1], indexing="ij")
+            middle = np.stack([BI + (SI - 1) / 2, BJ + (SJ - 1) / 2], axis=-1).reshape(-1, 2)
+            positions = middle * h
+
+            # Sorting the arrows by the tile where they start
+            tileIndex = np.floor(middle).astype(int) // TILE
+            tile = tileIndex[:, 0] * self.tilesShape[1] + tileIndex[:, 1]
+            order = np.argsort(tile, kind="stable")
+
+            gradient, magnitude = directions(meanX.ravel()[order], meanY.ravel()[order])
+            vertices = arrowVertices(positions[order], gradient, magnitude, block)
+
+            counts = np.bincount(tile, minlength=tileCount)
+            self.shapes += [bs.Shape(vertices.ravel(), arrowIndices(len(order)))]
+            self.starts += [6 * (np.cumsum(counts) - counts)]
+            self.counts += [6 * counts]
+
+            if block >= max(nh, nv):
+                break
+            block *= 2
+
+    def levels(self):
+        return len(self.shapes)
+
+    # Chooses the tiles to draw and their level, as seen from viewPos with the
+    # matrix projection @ view; returns, for each level, the starts and counts
+    # of the indices of its visible tiles
+    def visibleRanges(self, viewPos, matrix):
+
+        # The level of each tile keeps its arrows MIN_ARROW_ANGLE apart at its distance
+        closest = np.clip(viewPos[:2], self.bounds[:, :2], self.bounds[:, 2:])
+        distance = np.sqrt(np.sum((closest - viewPos[:2])**2, axis=1) + viewPos[2]**2)
+        level = np.ceil(np.log2(np.maximum(MIN_ARROW_ANGLE * distance / self.h, 1)))
+        level = np.minimum(level, self.levels() - 1).astype(int)
+
+        ranges = []
+        for l in range(self.levels()):
+            chosen = (level == l) & (self.counts[l] > 0)
+            chosen[chosen] = self.inside(self.bounds[chosen], ARROW_LENGTH * 2**l, matrix)
+            ranges += [(self.starts[l][chosen], self.counts[l][chosen])]
+
+        return ranges
+
+    # Whether the boxes over the floor [x min, y min, x max, y max], grown by a margin,
+    # are at least partially inside the frustum given by matrix = projection @ view
+    def inside(self, bounds, margin, matrix):
+        x0, y0, x1, y1 = (bounds + np.array([-1, -1, 1, 1]) * margin).T
+
+        corners = np.stack([
+            np.stack([x, y, np.full_like(x0, z), np.ones_like(x0)], axis=-1)
+            for x in [x0, x1] for y in [y0, y1] for z in [0, 2 * ARROW_HEIGHT]], axis=1)
+        clip = corners @ np.asarray(matrix).T
+
+        # A box is outside the frustum when all its corners are beyond the same plane
+        w = clip[:, :, 3]
+        outside = np.zeros(len(bounds), dtype=bool)
+        for axis in range(3):
+            outside |= np.all(clip[:, :, axis] > w, axis=1) | np.all(clip[:, :, axis] < -w, axis=1)
+
+        return ~outside
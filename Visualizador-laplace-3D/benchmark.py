@@ -0,0 +1,212 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Benchmark of the whole pipeline over hotels of increasing size: the solver,
+and the floor, arrows and curves the viewer builds, without drawing them
+"""
+
+import contextlib
+import io
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import profiler
+
+
+# Directory of the scripts benchmarked
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Stages faster than this (in seconds) are not compared, their changes are noise
+MIN_COMPARED_TIME = 0.005
+
+# Hotel used as the base of the problems, its rooms and precision change
+BASE_HOTEL = {
+    "window_loss": 0.01, "ambient_temperature": 20, "heater_power": 3,
+    "P": 1, "L": 4, "D": 5, "W": 0.1, "E": 1, "H1": 12, "H2": 2}
+
+
+# Returns the value given after a flag in the command line, or a default value
+def getOption(flag, default=None):
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+# Hotel of a number of rooms solved with a precision h, the windows alternate
+def syntheticHotel(rooms, h):
+    return dict(BASE_HOTEL, h=h, windows=[(r // 2) % 2 for r in range(rooms)])
+
+
+# Runs a function several times, returns its result, its best time
+# and the peak memory it allocated (in MB) on its first run
+def measure(function, repeat):
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return result, best, peak
+
+
+# Solves a problem with the solver in another process, so its memory is its own,
+# returns the profile it stores of its fastest run
+def benchmarkSolver(problem_name, solver, repeat):
+    command = [sys.executable, os.path.join(HERE, "hotel-solver.py"), problem_name,
+               "--profile", "--no-cache", "--force", "--solver", solver]
+
+    best = None
+    for _ in range(repeat):
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+        with open(problem_name[:problem_name.index(".")] + '_profile.json') as f:
+            profile = json.load(f)
+
+        if best is None or solverTime(profile) < solverTime(best):
+            best = profile
+
+    return best
+
+
+# Time of a run of the solver, without starting Python and importing the libraries
+def solverTime(profile):
+    return sum(phase["time"] for phase in profile["phases"].values())
+
+
+# Builds the shapes of the viewer for a solved problem, without a window
+def benchmarkViewer(problem_name, repeat):
+    arguments = sys.argv
+    sys.argv = ["hotel-viewer.py", problem_name]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            viewer = runpy.run_path(os.path.join(HERE, "hotel-viewer.py"), run_name="benchmark")
+            load = time.perf_counter() - start
+    finally:
+        sys.argv = arguments
+
+    solution = np.asarray(viewer["solution"], dtype=float)
+    h = viewer["PRECISION"]
+    ar = viewer["ar"]
+    ct = viewer["ct"]
+
+    results = {"load": {"time": load}}
+
+    floor, elapsed, peak = measure(viewer["createFloor"], repeat)
+    vertices = len(floor.vertices) // 4
+    results["floor"] = {"time": elapsed, "memory_mb": peak, "count": vertices, "throughput": vertices / elapsed}
+
+    pyramid, elapsed, peak = measure(lambda: ar.ArrowPyramid(solution, h), repeat)
+    arrows = sum(len(shape.indices) // 6 for shape in pyramid.shapes)
+    results["arrows"] = {"time": elapsed, "memory_mb": peak, "count": arrows, "throughput": arrows / elapsed}
+
+    levels = viewer["curveLevels"]()
+    curves = lambda: [viewer["curveVertices"](segments, level)
+                      for segments, level in zip(ct.contourSegments(solution, levels, solution == 0), levels)]
+    vertices, elapsed, peak = measure(curves, repeat)
+    segments = sum(len(curve) // 2 for curve in vertices)
+    results["curves"] = {"time": elapsed, "memory_mb": peak, "count": segments, "throughput": segments / elapsed}
+
+    return results
+
+
+# Benchmarks a hotel, the problem is written in directory
+# Its name has h in thousandths, as the scripts cut the names at their first dot
+def benchmarkCase(rooms, h, directory, solver, repeat):
+    problem_name = os.path.join(directory, "hotel_{}_h{}.json".format(rooms, int(round(h * 1000))))
+    with open(problem_name, "w") as f:
+        json.dump(syntheticHotel(rooms, h), f)
+
+    profile = benchmarkSolver(problem_name, solver, repeat)
+    unknowns = profile["values"]["unknowns"]
+    elapsed = solverTime(profile)
+
+    results = {
+        "solver": {
+            "time": elapsed, "memory_mb": profile["peak_rss_mb"], "count": unknowns,
+            "throughput": unknowns / elapsed, "nnz": profile["values"]["nnz"],
+            "phases": {name: phase["time"] for name, phase in profile["phases"].items()}}}
+    results.update(benchmarkViewer(problem_name, repeat))
+
+    return results
+
+
+# Compares the times of the results with a baseline, returns the stages that
+# are slower than it by more than tolerance (a fraction)
+def compare(results, baseline, tolerance):
+    slower = []
+
+    print("\n{:<16} {:<8} {:>10} {:>10} {:>8}".format("case", "stage", "baseline", "now", "ratio"))
+    for case, stages in results["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+
+        for stage, result in stages.items():
+            previous = baseline["cases"][case].get(stage)
+            if previous is None or max(previous["time"], result["time"]) < MIN_COMPARED_TIME:
+                continue
+
+            ratio = result["time"] / previous["time"]
+            mark = " slower" if ratio > 1 + tolerance else " faster" if ratio < 1 - tolerance else ""
+            print("{:<16} {:<8} {:>9.4f}s {:>9.4f}s {:>8.2f}{}".format(
+                case, stage, previous["time"], result["time"], ratio, mark))
+
+            if ratio > 1 + tolerance:
+                slower += [(case, stage, ratio)]
+
+    return slower
+
+
+if __name__ == "__main__":
+
+    # Sizes of the hotels, and how the stages are run
+    precisions = [float(h) for h in getOption("--h", "0.1,0.05,0.025").split(",")]
+    roomCounts = [int(rooms) for rooms in getOption("--rooms", "5,10").split(",")]
+    solver = getOption("--solver", "direct")
+    repeat = int(getOption("--repeat", 3))
+
+    output = getOption("--output", "benchmark_results.json")
+    directory = getOption("--directory") or tempfile.mkdtemp(prefix="hotel-benchmark-")
+    os.makedirs(directory, exist_ok=True)
+
+    results = {"settings": {"solver": solver, "repeat": repeat}, "cases": {}}
+
+    for rooms in roomCounts:
+        for h in precisions:
+            case = "{} rooms, h={}".format(rooms, h)
+            print("Benchmarking " + case + "...", end=" ", flush=True)
+
+            results["cases"][case] = benchmarkCase(rooms, h, directory, solver, repeat)
+            stages = results["cases"][case]
+            print(", ".join("{} {:.3f} s".format(stage, result["time"]) for stage, result in stages.items()))
+
+    results.update(profiler.environment())
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results stored in: " + output)
+
+    # Comparing with the results of a previous version, the run fails when a stage got slower
+    if "--baseline" in sys.argv:
+        with open(getOption("--baseline")) as f:
+            baseline = json.load(f)
+
+        slower = compare(results, baseline, float(getOption("--tolerance", 0.1)))
+        if slower:
+            print("\n{} stages are slower than the baseline.".format(len(slower)))
+            sys.exit(1)
+
+        print("\nNo stage is slower than the baseline.")
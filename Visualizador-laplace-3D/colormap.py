@@ -0,0 +1,168 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Colormaps applied on the GPU, the shapes store a value per vertex
+and a shader translates it into a color through a lookup table
+"""
+
+from OpenGL.GL import *
+import OpenGL.GL.shaders
+import numpy as np
+
+import easy_shaders as es
+
+
+# Colormaps, as colors equally spaced over the range of the values
+COLORMAPS = {
+    "heat": [[0, 0, 1], [1, 1, 1], [1, 0, 0]],
+    "gray": [[0.1, 0.1, 0.1], [1, 1, 1]],
+    "viridis": [[0.267, 0.005, 0.329], [0.229, 0.322, 0.546], [0.128, 0.567, 0.551],
+                [0.369, 0.789, 0.383], [0.993, 0.906, 0.144]],
+    "inferno": [[0.001, 0.000, 0.014], [0.341, 0.062, 0.429], [0.735, 0.216, 0.330],
+                [0.978, 0.557, 0.035], [0.988, 0.998, 0.645]]}
+
+# Entries of the lookup tables, 2^n + 1 so the colors of the colormaps fall on entries
+LUT_SIZE = 1025
+
+
+# Lookup table of a colormap, the colors are interpolated between its points
+def lookupTable(name):
+    points = np.array(COLORMAPS[name], dtype=np.float32)
+    positions = np.linspace(0, 1, len(points))
+    s = np.linspace(0, 1, LUT_SIZE)
+
+    return np.stack([np.interp(s, positions, points[:, c]) for c in range(3)], axis=-1).astype(np.float32)
+
+
+# Position of the values in the lookup table, from 0 to 1; the lower half of the
+# table goes from minValue to midValue and the upper half from midValue to maxValue
+def tablePosition(values, minValue, midValue, maxValue):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lower = 0.5 * (values - minValue) / (midValue - minValue)
+        upper = 0.5 + 0.5 * (values - midValue) / (maxValue - midValue)
+
+    return np.clip(np.where(values < midValue, lower, upper), 0, 1)
+
+
+# Colors of an array of values, computed as the shader does, with a new last axis for r, g, b
+def colors(values, name, minValue, midValue, maxValue):
+    s = tablePosition(np.asarray(values, dtype=float), minValue, midValue, maxValue)
+    return lookupTable(name)[np.rint(s * (LUT_SIZE - 1)).astype(int)]
+
+
+# Creates a 1D texture with the lookup table of a colormap
+def createTexture(name):
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_1D, texture)
+
+    glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+    glTexImage1D(GL_TEXTURE_1D, 0, GL_RGB32F, LUT_SIZE, 0, GL_RGB, GL_FLOAT, lookupTable(name))
+
+    return texture
+
+
+# Moves a shape to the GPU, its vertices are all the positions x, y, z
+# followed by one value per vertex, so the values can be replaced on their own
+def toGPUShape(shape):
+    gpuShape = es.toGPUShape(shape)
+    gpuShape.count = len(shape.vertices) // 4
+
+    return gpuShape
+
+
+# Replaces the values of a shape on the GPU, the positions are kept
+def updateValues(gpuShape, values):
+    values = np.ascontiguousarray(values, dtype=np.float32).ravel()
+    assert len(values) == gpuShape.count
+
+    glBindBuffer(GL_ARRAY_BUFFER, gpuShape.vbo)
+    glBufferSubData(GL_ARRAY_BUFFER, 12 * gpuShape.count, 4 * gpuShape.count, values)
+
+
+# Shader that colors each vertex by its value, using a lookup table
+# The range of the values and the table are uniforms, changing them costs nothing
+class ColormapShaderProgram:
+
+    def __init__(self):
+
+        vertex_shader = """
+            #version 130
+
+            uniform mat4 projection;
+            uniform mat4 view;
+            uniform mat4 model;
+
+            in vec3 position;
+            in float value;
+
+            out float newValue;
+            void main()
+            {
+                gl_Position = projection * view * model * vec4(position, 1.0f);
+                newValue = value;
+            }
+            """
+
+        fragment_shader = """
+            #version 130
+
+            uniform sampler1D lookupTable;
+            uniform float minValue;
+            uniform float midValue;
+            uniform float maxValue;
+            uniform float tableSize;
+
+            in float newValue;
+
+            out vec4 outColor;
+            void main()
+            {
+                float s = newValue < midValue
+                    ? 0.5f * (newValue - minValue) / (midValue - minValue)
+                    : 0.5f + 0.5f * (newValue - midValue) / (maxValue - midValue);
+
+                // Sampling at the centers of the first and last entries
+                s = clamp(s, 0.0f, 1.0f);
+                s = (s * (tableSize - 1.0f) + 0.5f) / tableSize;
+
+                outColor = vec4(texture(lookupTable, s).rgb, 1.0f);
+            }
+            """
+
+        self.shaderProgram = OpenGL.GL.shaders.compileProgram(
+            OpenGL.GL.shaders.compileShader(vertex_shader, OpenGL.GL.GL_VERTEX_SHADER),
+            OpenGL.GL.shaders.compileShader(fragment_shader, OpenGL.GL.GL_FRAGMENT_SHADER))
+
+    # Sets the range of the values and the lookup table used, the program must be in use
+    def setColormap(self, texture, minValue, midValue, maxValue):
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_1D, texture)
+
+        glUniform1i(glGetUniformLocation(self.shaderProgram, "lookupTable"), 0)
+        glUniform1f(glGetUniformLocation(self.shaderProgram, "minValue"), minValue)
+        glUniform1f(glGetUniformLocation(self.shaderProgram, "midValue"), midValue)
+        glUniform1f(glGetUniformLocation(self.shaderProgram, "maxValue"), maxValue)
+        glUniform1f(glGetUniformLocation(self.shaderProgram, "tableSize"), LUT_SIZE)
+
+    def drawShape(self, shape, mode=GL_TRIANGLES):
+        assert isinstance(shape, es.GPUShape)
+
+        # Binding the proper buffers
+        glBindVertexArray(shape.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, shape.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, shape.ebo)
+
+        # All the 3d positions (12 bytes each) are followed by all the values (4 bytes each)
+        position = glGetAttribLocation(self.shaderProgram, "position")
+        glVertexAttribPointer(position, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(position)
+
+        value = glGetAttribLocation(self.shaderProgram, "value")
+        glVertexAttribPointer(value, 1, GL_FLOAT, GL_FALSE, 4, ctypes.c_void_p(12 * shape.count))
+        glEnableVertexAttribArray(value)
+
+        # Render the active element buffer with the active shader program
+        glDrawElements(mode, shape.size, GL_UNSIGNED_INT, None)
@@ -0,0 +1,78 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Level curves of a solution over a grid, extracted with marching squares
+"""
+
+import numpy as np
+
+
+# Edges of a cell i,j of the grid, as its two corners (di, dj)
+# 0: bottom, 1: right, 2: top, 3: left
+EDGES = [((0, 0), (1, 0)), ((1, 0), (1, 1)), ((0, 1), (1, 1)), ((0, 0), (0, 1))]
+
+# Corners of a cell, their bit in the case of the cell is set when they are above the level
+CORNERS = [(0, 0), (1, 0), (1, 1), (0, 1)]
+
+# Segments of each case, as pairs of edges; the saddles (5 and 10) have two
+# possibilities, chosen by the value at the center of the cell
+SEGMENTS = {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)], 6: [(0, 2)], 7: [(3, 2)],
+    8: [(2, 3)], 9: [(0, 2)], 11: [(1, 2)], 12: [(1, 3)], 13: [(0, 1)], 14: [(3, 0)]}
+
+SADDLES = {
+    5: {True: [(0, 1), (2, 3)], False: [(3, 0), (1, 2)]},
+    10: {True: [(3, 0), (1, 2)], False: [(0, 1), (2, 3)]}}
+
+
+# Segments of the curve of a level, as an array n x 2 x 2 of points i,j (with fractions)
+# Cells with a corner marked in invalid (such as the walls) have no segments
+def levelSegments(values, level, invalid=None):
+    values = np.asarray(values, dtype=float)
+    nh, nv = values.shape
+
+    corner = lambda di, dj: values[di:nh - 1 + di, dj:nv - 1 + dj]
+
+    # Case of each cell, a bit for each corner above the level
+    case = np.zeros((nh - 1, nv - 1), dtype=np.uint8)
+    for bit, (di, dj) in enumerate(CORNERS):
+        case |= (corner(di, dj) > level).astype(np.uint8) << bit
+
+    if invalid is not None:
+        for di, dj in CORNERS:
+            case[invalid[di:nh - 1 + di, dj:nv - 1 + dj]] = 0
+
+    I, J = np.nonzero((case != 0) & (case != 15))
+    case = case[I, J]
+
+    # Point where the level crosses an edge of the cells I, J
+    def crossing(edge, I, J):
+        (di0, dj0), (di1, dj1) = EDGES[edge]
+        v0 = values[I + di0, J + dj0]
+        v1 = values[I + di1, J + dj1]
+        t = (level - v0) / (v1 - v0)
+        return np.stack([I + di0 + t * (di1 - di0), J + dj0 + t * (dj1 - dj0)], axis=-1)
+
+    segments = []
+    for number, edges in SEGMENTS.items():
+        cells = case == number
+        for first, second in edges:
+            segments += [np.stack([crossing(first, I[cells], J[cells]), crossing(second, I[cells], J[cells])], axis=1)]
+
+    for number, options in SADDLES.items():
+        cells = case == number
+        Ic, Jc = I[cells], J[cells]
+        center = sum(values[Ic + di, Jc + dj] for di, dj in CORNERS) / 4 > level
+
+        for above, edges in options.items():
+            chosen = center == above
+            for first, second in edges:
+                segments += [np.stack([crossing(first, Ic[chosen], Jc[chosen]),
+                                       crossing(second, Ic[chosen], Jc[chosen])], axis=1)]
+
+    return np.concatenate(segments) if segments else np.zeros((0, 2, 2))
+
+
+# Segments of the curves of several levels, a list with an array n x 2 x 2 for each level
+def contourSegments(values, levels, invalid=None):
+    return [levelSegments(values, level, invalid) for level in levels]
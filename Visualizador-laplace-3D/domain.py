@@ -0,0 +1,171 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Description of the domain of a Laplace problem, as a rectangle with walls inside
+and conditions over segments, and its rasterization over a grid
+"""
+
+import numpy as np
+
+
+# A domain is a dictionary, as it is written in the .json of a problem
+#   "width", "height": size of the rectangle [0, width] x [0, height]
+#   "walls": rectangles [x0, y0, x1, y1], their surfaces are insulated
+#   "dirichlet": segments [x0, y0, x1, y1, value] with a fixed temperature
+#   "neumann": segments [x0, y0, x1, y1, flux] over the border of the domain,
+#              the flux enters the domain, the rest of the border is insulated
+#   "depth": optional height of the rooms, the domain is then extruded in 3D,
+#            the walls reach from the floor to the ceiling, which are insulated,
+#            and a segment may end with [..., z0, z1] to cover only those heights
+# Walls may go beyond the domain to close it
+
+
+# Domain of the hotel defined by P, L, D, W, E, H1, H2 and one window per room
+def hotelDomain(data):
+    P = data["P"]
+    L = data["L"]
+    D = data["D"]
+    W = data["W"]
+    E = data["E"]
+    H1 = data["H1"]
+    H2 = data["H2"]
+
+    windows = data["windows"]
+    rooms = len(windows)
+
+    # In 3D the windows start above the floor, as they are drawn by the viewer
+    heights = [0.3 * data["depth"], data["depth"]] if "depth" in data else []
+
+    width = rooms * L + (rooms - 1) * W
+    height = P + W + D
+
+    walls = []
+    dirichlet = []
+    neumann = [[H1, 0, H1 + H2, 0, data["heater_power"]]]
+
+    for r in range(rooms):
+        start = r * (L + W)
+
+        # Wall between the room and the corridor, the door is at its right
+        # It goes under the wall between rooms, the first one goes beyond the domain
+        wallStart = start - W if r > 0 else -1
+        walls += [[wallStart, P, start + L - E, P + W]]
+
+        # Wall between this room and the next one, it goes beyond the top of the domain
+        if r < rooms - 1:
+            walls += [[start + L, P, start + L + W, height + 1]]
+
+        # The windows of the first and last room reach the corners of the domain
+        lo = start if r > 0 else 0
+        hi = start + L if r < rooms - 1 else width
+
+        if bool(windows[r]):
+            neumann += [[lo, height, hi, height, -data["window_loss"]] + heights]
+        else:
+            dirichlet += [[lo, height, hi, height, data["ambient_temperature"]] + heights]
+
+    hotel = {"width": width, "height": height, "walls": walls, "dirichlet": dirichlet, "neumann": neumann}
+    if "depth" in data:
+        hotel["depth"] = data["depth"]
+
+    return hotel
+
+
+# Domain of a problem, given explicitly or as a hotel
+def problemDomain(data):
+    if "domain" in data:
+        return data["domain"]
+    return hotelDomain(data)
+
+
+# Number of points of the grid of a domain with a distance h between its points,
+# nh x nv, or nh x nv x nd when the domain has a depth
+def gridShape(domain, h):
+    shape = (int(domain["width"] / h) + 1, int(domain["height"] / h) + 1)
+    if "depth" in domain:
+        shape += (int(domain["depth"] / h) + 1,)
+    return shape
+
+
+# Transforms a measure into an index, measures beyond the domain give indices outside it
+def index(value, h):
+    return int(np.floor(value / h + 0.0001))
+
+
+# Rasterizes a domain over a grid with a distance h between its points, returns
+#   solid: points inside the walls
+#   cuts: for each axis, links between a point and the next one along it that cross a wall
+#   fixed, values: points with a fixed temperature and that temperature
+#   fluxes: for each axis, the flux that enters through its lower and upper borders
+# The arrays are indexed by i,j in 2D and by i,j,l in 3D
+def rasterize(domain, h):
+    shape = gridShape(domain, h)
+    nh, nv = shape[:2]
+
+    # Indices lo to hi - 1 along an axis, without the ones before the grid; each wall and
+    # segment only writes the window of the grid it covers, instead of a mask of the grid
+    window = lambda lo, hi: slice(max(lo, 0), max(hi, 0))
+
+    solid = np.zeros((nh, nv), dtype=bool)
+    cutX = np.zeros((nh - 1, nv), dtype=bool)
+    cutY = np.zeros((nh, nv - 1), dtype=bool)
+
+    # Points strictly inside a wall are solid, as is any link whose
+    # middle point is strictly inside it; the surface of the wall is not
+    for x0, y0, x1, y1 in domain["walls"]:
+        xa, ya, xb, yb = index(x0, h), index(y0, h), index(x1, h), index(y1, h)
+        solid[window(xa + 1, xb), window(ya + 1, yb)] = True
+        cutX[window(xa, xb), window(ya + 1, yb)] = True
+        cutY[window(xa + 1, xb), window(ya, yb)] = True
+
+    # Indices of a segment, the grid may fall short of the border by less than h
+    ix = lambda x: min(index(x, h), nh - 1)
+    iy = lambda y: min(index(y, h), nv - 1)
+
+    # In 3D the walls go from the floor to the ceiling, and the segments
+    # cover the heights z0 to z1 of the vertical border
+    if len(shape) == 3:
+        nd = shape[2]
+        iz = lambda z: min(index(z, h), nd - 1)
+
+        extrude = lambda mask: np.repeat(mask[:, :, np.newaxis], nd, axis=2)
+        solid, cutX, cutY = extrude(solid), extrude(cutX), extrude(cutY)
+        cuts = [cutX, cutY, np.zeros((nh, nv, nd - 1), dtype=bool)]
+
+        def heights(condition):
+            z0, z1 = condition[5:7] if len(condition) > 5 else (0, domain["depth"])
+            return (window(iz(z0), iz(z1) + 1),)
+    else:
+        cuts = [cutX, cutY]
+        heights = lambda condition: ()
+
+    # Window of the points over a segment, the later segments prevail
+    def segment(condition):
+        x0, y0, x1, y1 = condition[:4]
+        return (window(ix(x0), ix(x1) + 1), window(iy(y0), iy(y1) + 1)) + heights(condition)
+
+    fixed = np.zeros(shape, dtype=bool)
+    values = np.zeros(shape)
+    for condition in domain.get("dirichlet", []):
+        points = segment(condition)
+        fixed[points] = True
+        values[points] = condition[4]
+
+    # The floor and the ceiling are insulated
+    fluxes = [[np.zeros(shape[:axis] + shape[axis + 1:]) for _ in range(2)] for axis in range(len(shape))]
+    for condition in domain.get("neumann", []):
+        x0, y0, x1, y1, flux = condition[:5]
+        points = segment(condition)
+
+        # The flux only crosses the border the segment lies on
+        if ix(x1) <= 0:
+            fluxes[0][0][points[1:]] = flux
+        if ix(x0) >= nh - 1:
+            fluxes[0][1][points[1:]] = flux
+        if iy(y1) <= 0:
+            fluxes[1][0][points[:1] + points[2:]] = flux
+        if iy(y0) >= nv - 1:
+            fluxes[1][1][points[:1] + points[2:]] = flux
+
+    return {"shape": shape, "solid": solid, "cuts": cuts,
+            "fixed": fixed & ~solid, "values": values, "fluxes": fluxes}
@@ -88,6 +88,15 @@ def toGPUShape(shape, wrapMode=None, filterMode=None):
     return gpuShape
 
 
+# Frees the memory used by a shape on the GPU, it can't be drawn afterwards
+def clearGPUShape(gpuShape):
+    glDeleteVertexArrays(1, [gpuShape.vao])
+    glDeleteBuffers(2, [gpuShape.vbo, gpuShape.ebo])
+
+    if gpuShape.texture:
+        glDeleteTextures([gpuShape.texture])
+
+
 
 class SimpleShaderProgram:
 
@@ -386,6 +395,31 @@ class SimpleModelViewProjectionShaderProgram:
         glDrawElements(mode, shape.size, GL_UNSIGNED_INT, None)
 
 
+    # Draws only some ranges of the indices of a shape, in a single call
+    # starts and counts are given in indices, not in bytes
+    def drawShapeRanges(self, shape, starts, counts, mode=GL_TRIANGLES):
+        assert isinstance(shape, GPUShape)
+
+        if len(starts) == 0:
+            return
+
+        # Binding the proper buffers
+        glBindVertexArray(shape.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, shape.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, shape.ebo)
+
+        position = glGetAttribLocation(self.shaderProgram, "position")
+        glVertexAttribPointer(position, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(position)
+
+        color = glGetAttribLocation(self.shaderProgram, "color")
+        glVertexAttribPointer(color, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+        glEnableVertexAttribArray(color)
+
+        offsets = (ctypes.c_void_p * len(starts))(*[SIZE_IN_BYTES * int(start) for start in starts])
+        glMultiDrawElements(mode, np.asarray(counts, dtype=np.int32), GL_UNSIGNED_INT, offsets, len(starts))
+
+
 class SimpleTextureModelViewProjectionShaderProgram:
 
     def __init__(self):
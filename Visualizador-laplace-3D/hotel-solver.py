@@ -7,290 +7,658 @@ border conditions over a rectangular domain
 
 import numpy as np
 import matplotlib.pyplot as mpl
+import contextlib
 import json
+import os
 import sys
+import time
+
+from multiprocessing import Pool
 
 # Imports from scipy in order to use a sparse matrix
-from scipy.sparse import csc_matrix
-from scipy.sparse.linalg import spsolve
-
-
-# Loads a .json file that setups the problem
-if len(sys.argv) <= 1:
-    print("Invalid setup data.")
-    sys.exit()
-
-name = sys.argv[1]
-
-with open(name) as j:
-    data = json.load(j)
-
-# Problem setup
-# Geometry
-P = data["P"]
-L = data["L"]
-D = data["D"]
-W = data["W"]
-E = data["E"]
-H1 = data["H1"]
-H2 = data["H2"]
-
-# Conditions
-ambient_temperature = data["ambient_temperature"]
-window_loss = -data["window_loss"] #du/dx at window
-heater_power = data["heater_power"] #du/dx at heater
-windows = data["windows"]
-
-# Precision
-h = 0.1
-
-# Number of unknowns
-nh = int((5 * L + 4 * W) / h) + 1
-nv = int((P + D + W) / h) + 1
-
-# The domain is a rectangle
-N = nh * nv
-
-# Functions to convert the indices from i,j to k and viceversa
-# i,j indexes the discrete domain in 2D; k parametrizes i,j
-def getK(i, j):
-    return j * nh + i
-
-def getIJ(k):
-    i = k % nh
-    j = k // nh
-    return (i, j)
-
-# Transforms a measure into a valid index
-def idx(value):
-    global h
-    return int(value / h + 0.0001)
-
-# 0 - 1 - 2
-# 3 - 4 - 5
-# 6 - 7 - 8
-# Checks where a value is related to 2 vertical boundaries
-# and a list of 2 horizontal boundaries
-def boundary_check(i, j, xs, ys):
-    for idx in range(0, len(xs), 2):
-        if xs[idx] == i and ys[0] == j:
-            return 6
-        if xs[idx] == i and ys[0] < j < ys[1]:
-            return 3
-        if xs[idx] == i and j == ys[1]:
-            return 0
-        if xs[idx] < i < xs[idx + 1] and ys[0] == j:
-            return 7
-        if xs[idx] < i < xs[idx + 1] and ys[0] < j < ys[1]:
-            return 4
-        if xs[idx] < i < xs[idx + 1] and j == ys[1]:
-            return 1
-        if i == xs[idx + 1] and ys[0] == j:
-            return 8
-        if i == xs[idx + 1] and ys[0] < j < ys[1]:
-            return 5
-        if i == xs[idx + 1] and j == ys[1]:
-            return 2
-    return -1
-
-# Assings values to M according to the mode used
-def asign(M, k, kls, mode):
-    if mode == 4:
-        M[k, k] = -1
+from scipy.sparse import coo_matrix, csr_matrix, diags, identity
+
+import linear_solvers as lsv
+import profiler
+import solution_file as sf
+import solve_cache as sc
+import domain
+
+
+# Distance between the points of the grid when the problem doesn't define it
+DEFAULT_H = 0.1
+
+
+# Returns the value given after a flag in the command line, or a default value
+def getOption(flag, default=None):
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+# Builds the matrix and the right side of the equations of a problem,
+# using a grid with a distance h between its points
+# It is a five-point stencil in 2D, or a seven-point one when the problem has a depth
+def assemble(data, h):
+
+    # The domain is a rectangle (or a box), rasterized over the grid
+    with phase("index setup"):
+        raster = domain.rasterize(domain.problemDomain(data), h)
+        shape = raster["shape"]
+        N = int(np.prod(shape))
+
+        # Indices k of each point i,j (or i,j,l), where k = j * nh + i (+ l * nh * nv)
+        K = np.arange(N).reshape(shape, order="F")
+
+    with phase("assembly"):
+        return assembleStencil(raster, K, h)
+
+
+# Matrix and right side of the equations of a rasterized domain,
+# K holds the index k of each point of the grid, whose points are h apart
+def assembleStencil(raster, K, h):
+    shape = K.shape
+    N = K.size
+
+    # Coefficients of the stencil of every point, the vector that contains the
+    # right side of the equations, and the neighbors of each point:
+    # (coefficients, axis, step along the axis)
+    center = np.full(shape, -2.0 * len(shape))
+    rhs = np.zeros(shape)
+    neighbors = []
+
+    # Selects the first or last layer of points along an axis
+    layer = lambda axis, index: (slice(None),) * axis + (index,)
+
+    for axis, cut in enumerate(raster["cuts"]):
+
+        # Links of each point with its neighbors, they are missing at the border and across walls
+        hasNext = np.zeros(shape, dtype=bool)
+        hasPrevious = np.zeros(shape, dtype=bool)
+        hasNext[layer(axis, slice(None, -1))] = ~cut
+        hasPrevious[layer(axis, slice(1, None))] = ~cut
+
+        # A missing neighbor is replaced by the mirror of the opposite one (Neumann condition)
+        pair = lambda has, opposite: np.where(has, np.where(opposite, 1.0, 2.0), 0.0)
+        neighbors += [(pair(hasNext, hasPrevious), axis, 1), (pair(hasPrevious, hasNext), axis, -1)]
+        center += 2 * (~hasNext & ~hasPrevious)
+
+        # Flux that enters through the border, such as the heater or the closed windows
+        lower, upper = raster["fluxes"][axis]
+        rhs[layer(axis, 0)] -= 2 * h * lower * hasNext[layer(axis, 0)]
+        rhs[layer(axis, -1)] -= 2 * h * upper * hasPrevious[layer(axis, -1)]
+
+    # Points with a fixed temperature, such as the open windows, are known
+    # values for their neighbors, the solid points are fixed at 0
+    fixed = raster["fixed"] | raster["solid"]
+    values = np.where(raster["solid"], 0.0, raster["values"])
+
+    for coefs, axis, step in neighbors:
+        known = (coefs != 0) & np.roll(fixed, -step, axis)
+
+        rhs[known] -= coefs[known] * np.roll(values, -step, axis)[known]
+        coefs[known] = 0
+        coefs[fixed] = 0
+
+    center[fixed] = -1
+    rhs[fixed] = -values[fixed]
+
+    # Emitting all the coefficients as (row, column, value) triplets
+    rows = [K.ravel()]
+    cols = [K.ravel()]
+    vals = [center.ravel()]
+
+    for coefs, axis, step in neighbors:
+        nonzero = coefs != 0
+        stride = int(np.prod(shape[:axis]))
+
+        rows += [K[nonzero]]
+        cols += [K[nonzero] + step * stride]
+        vals += [coefs[nonzero]]
+
+    A = coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(N, N))
+
+    # Right side of the equations in the order given by k
+    b = rhs.ravel(order="F")
+
+    return A.tocsc(), b, shape
+
+
+# Cache of solutions shared by all the runs, None when it is disabled
+CACHE = None
+
+# Profile of the run, None unless --profile is given
+PROFILE = None
+
+
+# Times a phase of the run when it is profiled
+def phase(name):
+    return PROFILE.phase(name) if PROFILE is not None else contextlib.nullcontext()
+
+
+# Adds the times of a solver report to the profile, split between the factorization
+# (or the preconditioner) and the solution itself
+def profileSolver(A, report):
+    if PROFILE is None:
+        return
+
+    PROFILE.record("factorization", report["setup"])
+    PROFILE.record("solve", report["time"] - report["setup"])
+    PROFILE.set("unknowns", A.shape[0])
+    PROFILE.set("nnz", int(A.nnz))
+    PROFILE.set("solver", {key: report[key] for key in ["solver", "preconditioner", "iterations", "residual"]})
+
+
+# Enables the cache, also used to set it up in the processes of a pool
+def setCache(directory, maxSize):
+    global CACHE
+    CACHE = sc.SolveCache(directory, maxSize) if directory is not None else None
+
+
+# Settings of the solver that may change a solution
+def solverSettings(options):
+    if options.get("solver", "direct") == "direct":
+        return {"solver": "direct"}
+    return {key: options.get(key) for key in ["solver", "precond", "tol"]}
+
+
+# Solves a problem using a grid with a distance h between its points,
+# the options choose the method used by linear_solvers.solveSystem
+def solve(data, h, **options):
+    if CACHE is not None:
+        key = CACHE.key(data, h, solverSettings(options))
+        u = CACHE.get(key)
+        if u is not None:
+            print("Solution found in the cache.")
+            return u
+
+    A, b, shape = assemble(data, h)
+
+    x, report = lsv.solveSystem(A, b, shape=shape, **options)
+    profileSolver(A, report)
+
+    print("Solver {} ({}): {} iterations, residual {:.2e}, {:.2f} s".format(
+        report["solver"], report["preconditioner"], report["iterations"], report["residual"], report["time"]))
+
+    u = toGrid(x, shape)
+
+    if CACHE is not None:
+        CACHE.put(key, u, h, extents(data), data)
+
+    return u
+
+
+# Stores the profile of the run as base_profile.json, when there is one
+def saveProfile(base):
+    if PROFILE is None:
         return
-    M[k, kls[0]] = 1 + int(mode == 1) - int(mode == 7)
-    M[k, kls[1]] = 1 + int(mode == 7) - int(mode == 1)
-    M[k, kls[2]] = 1 + int(mode == 3) - int(mode == 5)
-    M[k, kls[3]] = 1 + int(mode == 5) - int(mode == 3)
-    M[k, k] = -4
-
-# Sets the correct values of a window
-def set_window(M, m, k, kls, i, closed, ls):
-    global window_loss
-    global ambient_temperature
-
-    if closed:
-        M[k, kls[1]] = 2
-        M[k, kls[2]] = 1 + int(i == ls[1]) - int(i == ls[0])
-        M[k, kls[3]] = 1 + int(i == ls[0]) - int(i == ls[1])
-        M[k, k] = -4
-        m[k] = -2 * h * window_loss
+
+    profile_name = base + '_profile.json'
+    PROFILE.write(profile_name)
+    print(PROFILE.summary())
+    print("Profile stored in: " + profile_name)
+
+
+# Solution in the discrete domain, indexed by i,j in 2D and by i,j,l in 3D
+def toGrid(x, shape):
+    with phase("reshape"):
+        return np.reshape(x, shape, order="F").copy()
+
+
+# Limits of the domain of a problem, [[x min, x max], [y min, y max]],
+# followed by [z min, z max] in 3D
+def extents(data):
+    problemDomain = domain.problemDomain(data)
+    limits = [[0, problemDomain["width"]], [0, problemDomain["height"]]]
+    if "depth" in problemDomain:
+        limits += [[0, problemDomain["depth"]]]
+    return limits
+
+
+# Format used to store the solutions, changed by the command line
+STORAGE = {"dtype": np.float64, "compress": False}
+
+
+# Stores a solution as base_solution.sol, along with its grid spacing and problem
+def saveSolution(base, u, h, data):
+    solution_name = base + '_solution.sol'
+    with phase("save"):
+        sf.writeSolution(solution_name, u, h, extents(data), data, **STORAGE)
+
+    return solution_name
+
+
+# Loads a solution stored by saveSolution and its header, None if there is none
+def loadSolution(base):
+    try:
+        header, u = sf.openSolution(base + '_solution.sol')
+        return np.array(u), header
+    except (OSError, ValueError):
+        return None
+
+
+# Solves a problem again after some of its parameters changed
+# The direct solver reuses the factors of the matrix that the previous run stored as
+# base_factors.npz: when only the right side changed it is a back-solve, when a few rows
+# changed it is a low rank update, otherwise (or when there are no factors yet) the matrix
+# is factorized and its factors are stored for the next run
+# An iterative solver starts from the stored solution instead
+def resolve(data, h, base, **options):
+    start = time.perf_counter()
+
+    previous = loadSolution(base)
+    if previous is not None and previous[1].get("problem") is not None:
+        parameters = [key for key in data if data[key] != previous[1]["problem"].get(key)]
+        print("Changed parameters:", ", ".join(parameters) if parameters else "none")
+
+        if not parameters and previous[1]["h"] == h:
+            return previous[0]
+
+    A, b, shape = assemble(data, h)
+
+    if options.get("solver", "direct") != "direct":
+        if previous is None or tuple(previous[0].shape) != shape or previous[1]["h"] != h:
+            print("There is no previous solution with the same grid, starting from zero.")
+            return solve(data, h, **options)
+
+        x, report = lsv.solveSystem(A, b, shape=shape, x0=previous[0].ravel(order="F"), **options)
+        profileSolver(A, report)
+
+        print("Solver {} ({}): {} iterations, residual {:.2e}, {:.2f} s".format(
+            report["solver"], report["preconditioner"], report["iterations"], report["residual"], report["time"]))
+
+        return toGrid(x, shape)
+
+    factorsName = base + "_factors.npz"
+    with phase("factorization"):
+        factorization = lsv.loadFactorization(factorsName)
+
+    rows = None
+    if factorization is not None and factorization.A.shape == A.shape:
+        rows = factorization.difference(A)[1]
+        print(len(rows), "of", len(b), "rows of the matrix changed.")
+
+    if rows is not None and factorization.updatable(A, rows):
+        with phase("solve"):
+            x = factorization.solve(b, A)
+        method = "back-solve" if len(rows) == 0 else "low rank update of rank {}".format(len(rows))
+    else:
+        with phase("factorization"):
+            factorization = lsv.CachedFactorization(A)
+            factorization.save(factorsName)
+        with phase("solve"):
+            x = factorization.solve(b)
+        method = "new factorization, stored in " + factorsName
+
+    residual = np.linalg.norm(b - A @ x) / max(np.linalg.norm(b), 1e-300)
+    print("Incremental solve: {}, residual {:.2e}, {:.2f} s".format(method, residual, time.perf_counter() - start))
+
+    return toGrid(x, shape)
+
+
+# Methods of the transient mode, by the weight of the next step in the time derivative
+TIME_METHODS = {"euler": 1.0, "cn": 0.5}
+
+
+# Solves the heat equation du/dt = diffusivity * laplacian(u) from an initial state, with
+# backward Euler or Crank-Nicolson, storing a frame every few steps in base_frames.sol
+# The matrix of the steps doesn't change, so it is factorized (or preconditioned) only once
+def transient(data, h, base, initial, steps, dt, method="euler", diffusivity=1.0, every=1, **options):
+    A, b, shape = assemble(data, h)
+    A = csr_matrix(A)
+
+    # Points with a fixed temperature (their rows are -u = -value) keep it, the rest evolve
+    fixed = (np.diff(A.indptr) == 1) & (A.diagonal() == -1)
+    D = diags((~fixed).astype(float))
+
+    # A u - b is h^2 times the laplacian, so each step solves
+    # (I - theta c D A) u_next = (I + (1 - theta) c D A) u - c D b
+    theta = TIME_METHODS[method]
+    c = diffusivity * dt / h**2
+
+    I = identity(len(b), format="csr")
+    implicit = csr_matrix(I - theta * c * D @ A)
+    explicit = csr_matrix(I + (1 - theta) * c * D @ A)
+    source = c * (D @ b)
+
+    solver = options.get("solver", "direct")
+    if solver == "direct":
+        factorization = lsv.CachedFactorization(implicit)
+        step = lambda rhs, x: factorization.solve(rhs)
+    else:
+        # The multigrid method is used as the preconditioner, so it is built once
+        if solver == "mg":
+            options = dict(options, solver="bicgstab", precond="mg")
+
+        M = lsv.preconditioner(implicit, options.get("precond", "mg"), shape)
+        step = lambda rhs, x: lsv.solveSystem(implicit, rhs, x0=x, shape=shape, M=M, **options)[0]
+
+    u = np.ravel(initial, order="F").astype(float)
+    u[fixed] = -b[fixed]
+
+    frames = steps // every + 1
+    frames_name = base + '_frames.sol'
+    writer = sf.FrameWriter(frames_name, frames, shape, h, extents(data), data, dtype=STORAGE["dtype"],
+                            dt=dt * every, method=method, diffusivity=diffusivity)
+    writer.write(0, toGrid(u, shape))
+
+    start = time.perf_counter()
+    for n in range(1, steps + 1):
+        u = step(explicit @ u - source, u)
+
+        if n % every == 0:
+            writer.write(n // every, toGrid(u, shape))
+
+    writer.close()
+
+    print("{} steps of {} with dt = {}, {} frames, {:.2f} s".format(
+        steps, method, dt, frames, time.perf_counter() - start))
+
+    return frames_name
+
+
+# Maximum difference between a solution and a finer one with half its spacing
+def solutionChange(coarse, fine):
+    sampled = fine[(slice(None, None, 2),) * fine.ndim]
+    common = tuple(slice(min(n, m)) for n, m in zip(coarse.shape, sampled.shape))
+    return np.max(np.abs(coarse[common] - sampled[common]))
+
+
+# Solves a problem in a process of its own, returns the solution, its time, the memory
+# (in MB) the peak of the process grew while solving it, None where it is unknown,
+# and the phases it profiled
+# The peak of the process includes the factors of SuperLU, that Python doesn't track
+def measuredSolve(data, h, options):
+    global PROFILE
+    if PROFILE is not None:
+        PROFILE = profiler.Profile()
+
+    before = profiler.peakRSS()
+    start = time.perf_counter()
+
+    u = solve(data, h, **options)
+
+    elapsed = time.perf_counter() - start
+    memory = profiler.peakRSS() - before if before is not None else None
+
+    return u, elapsed, memory, PROFILE.phases if PROFILE is not None else {}
+
+
+# Solves a problem at h, h/2, h/4... until the solution stops changing,
+# returns the finest solution and its spacing
+# Each grid is solved in a new process, so its memory is measured from the same start,
+# and without the cache, which would give the time of reading a stored solution instead
+def refine(data, coarsest, levels, tolerance, **options):
+    previous = None
+    cheapest = None
+
+    pool = Pool(1, initializer=setCache, initargs=(None, 0), maxtasksperchild=1)
+
+    for level in range(levels):
+        h = coarsest / 2**level
+
+        u, elapsed, memory, phases = pool.apply(measuredSolve, (data, h, options))
+        for name, solvePhase in phases.items():
+            PROFILE.record(name, solvePhase["time"])
+
+        report = "h = {:.4f}, {} unknowns, {:.2f} s, peak memory {}".format(
+            h, u.size, elapsed, "{:.1f} MB".format(memory) if memory is not None else "unknown")
+
+        if previous is None:
+            print(report)
+        else:
+            change = solutionChange(previous, u)
+            print(report + ", change {:.4f}".format(change))
+
+            # The previous grid was already close enough to this one
+            if change < tolerance:
+                cheapest = 2 * h
+                break
+
+        previous = u
+
+    pool.close()
+    pool.join()
+
+    if cheapest is None:
+        print("The solution didn't converge to a tolerance of", tolerance)
+    else:
+        print("Cheapest grid within a tolerance of", tolerance, "is h =", cheapest)
+
+    return u, h
+
+
+# Loads the problems of a directory of .json files or of a .jsonl file,
+# returns a list of (base name of the solution, problem) pairs
+def loadProblems(path):
+    problems = []
+
+    if os.path.isdir(path):
+        for fileName in sorted(os.listdir(path)):
+            if fileName.endswith(".json"):
+                with open(os.path.join(path, fileName)) as j:
+                    problems += [(os.path.join(path, fileName[:-5]), json.load(j))]
     else:
-        m[k] = -ambient_temperature
-    
-        #Equation associated with j - 1
-        k = getK(i, j - 1)
-        A[k, getK(i, j)] = 0
-        b[k] = -ambient_temperature
-
-
-# Matrix of unknown coefficients
-A = np.zeros((N, N))
-
-# Vector that contais the right side of the equations
-b = np.zeros((N,))
-
-# Constants that are used over and over in the iterarion
-parallel_xs = [0, idx(L - E), idx(L), idx(2 * L + W - E), idx(2 * L + W), idx(3 * L + 2 * W - E)]
-parallel_xs += [idx(3 * L + 2 * W), idx(4 * L + 3 * W - E), idx(4 * L + 3 * W), idx(5 * L + 4 * W - E)]
-parallel_ys = [idx(P), idx(P + W)]
-
-perpendicular_xs = [idx(L), idx(L + W), idx(2 * L + W), idx(2 * (L + W))]
-perpendicular_xs += [idx(3 * L + 2 * W), idx(3 * (L + W)), idx(4 * L + 3 * W), idx(4 * (L + W))]
-perpendicular_ys = [idx(P), nv - 1]
-
-# Iterating over each point inside the domain
-# Each point has an equation associated
-# The equation is different depending on the point location inside the domain
-for i in range(0, nh):
-    for j in range(0, nv):
-
-        #Equation associated with row k
-        k = getK(i, j)
-
-        # Indices of the other coefficients
-        k_up = getK(i, j + 1)
-        k_down = getK(i, j - 1)
-        k_left = getK(i - 1, j)
-        k_right = getK(i + 1, j)
-        kls = [k_up, k_down, k_left, k_right]
-
-        # Depending on the location of the point, the equation is different
-        # Interior
-        if 1 <= i <= nh - 2 and 1 <= j <= nv - 2:
-
-            # Checks if the point is in an interior wall
-            parallel = boundary_check(i, j, parallel_xs, parallel_ys)
-            if parallel > 1:
-                asign(A, k, kls, parallel)
-            else:
-                perpendicular = boundary_check(i, j, perpendicular_xs, perpendicular_ys)
-                if parallel == 1 and perpendicular == -1:
-                    asign(A, k, kls, parallel)
-                elif parallel == 1 and perpendicular == 5:
-                    A[k, k_up] = 2
-                    A[k, k_right] = 2
-                    A[k, k] = -4
-                else:
-                    asign(A, k, kls, perpendicular)
-        
-        # Left
-        elif i == 0 and 1 <= j <= nv - 2:
-            A[k, k] = -4
-
-            if j == idx(P):
-                A[k, k_down] = 2
-                A[k, k_right] = 2
-            elif j == idx(P + W):
-                A[k, k_up] = 2
-                A[k, k_right] = 2
-            elif idx(P) < j < idx(P + W):
-                asign(A, k, kls, 4)
-            else:
-                asign(A, k, kls, 5)
-        
-        # Right
-        elif i == nh - 1 and 1 <= j <= nv - 2:
-            asign(A, k, kls, 3)
-        
-        # Bottom
-        elif 1 <= i <= nh - 2 and j == 0:
-            asign(A, k, kls, 1)
-            b[k] = -2 * h * heater_power * bool(idx(H1) <= i <= idx(H1 + H2))
-        
-        # Top
-        elif 1 <= i <= nh - 2 and j == nv - 1:
-            A[k, k] = -1
-
-            if 1 <= i <= idx(L):
-                set_window(A, b, k, kls, i, bool(windows[0]), [1, idx(L)])
-            
-            elif idx(L + W) <= i <= idx(2 * L + W):
-                set_window(A, b, k, kls, i, bool(windows[1]), [idx(L + W), idx(2 * L + W)])
-            
-            elif idx(2 * (L + W)) <= i <= idx(3 * L + 2 * W):
-                set_window(A, b, k, kls, i, bool(windows[2]), [idx(2 * (L + W)), idx(3 * L + 2 * W)])
-            
-            elif idx(3 * (L + W)) <= i <= idx(4 * L + 3 * W):
-                set_window(A, b, k, kls, i, bool(windows[3]), [idx(3 * (L + W)), idx(4 * L + 3 * W)])
-            
-            elif idx(4 * (L + W)) <= i <= idx(5 * L + 4 * W):
-                set_window(A, b, k, kls, i, bool(windows[4]), [idx(4 * (L + W)), idx(5 * L + 4 * W)])
-
-        # Corner lower left
-        elif (i, j) == (0, 0):
-            A[k, k_up] = 2
-            A[k, k_right] = 2
-            A[k, k] = -4
-
-        # Corner lower right
-        elif (i, j) == (nh - 1, 0):
-            A[k, k_up] = 2
-            A[k, k_left] = 2
-            A[k, k] = -4
-
-        # Corner upper left
-        elif (i, j) == (0, nv - 1):
-            if bool(windows[0]):
-                A[k, k_down] = 2
-                A[k, k_right] = 2
-                A[k, k] = -4
-                b[k] = -2 * h * window_loss
-            else:
-                A[k, k] = -1
-                b[k] = -ambient_temperature
-
-                k2 = getK(i, j - 1)
-                A[k2, getK(i, j)] = 0
-                b[k2] = -ambient_temperature
-
-        # Corner upper right
-        elif (i, j) == (nh - 1, nv - 1):
-            if bool(windows[4]):
-                A[k, k_down] = 2
-                A[k, k_left] = 2
-                A[k, k] = -4
-                b[k] = -2 * h * window_loss
-            else:
-                A[k, k] = -1
-                b[k] = -ambient_temperature
-
-                k2 = getK(i, j - 1)
-                A[k2, getK(i, j)] = 0
-                b[k2] = -ambient_temperature
+        base = path[:path.rindex(".")]
+        with open(path) as lines:
+            for number, line in enumerate(lines):
+                if line.strip():
+                    problems += [(base + "_" + str(number), json.loads(line))]
+
+    return problems
+
+
+# Problems with the same geometry and grid only differ in the right side of
+# the equations and in the rows of their windows (or fixed segments)
+def geometryKey(data):
+    h = data.get("h", DEFAULT_H)
+
+    if "domain" in data:
+        problemDomain = data["domain"]
+        return (problemDomain["width"], problemDomain["height"], problemDomain.get("depth"),
+                json.dumps(problemDomain["walls"]), h)
+
+    return tuple(data[key] for key in ["P", "L", "D", "W", "E"]) + (len(data["windows"]), data.get("depth"), h)
+
 
+# Rows of the matrix that change between problems of the same geometry,
+# the open windows of a hotel or the position of the fixed segments of a domain
+def fixedPattern(data):
+    if "domain" in data:
+        return tuple(tuple(segment[:4] + segment[5:]) for segment in data["domain"].get("dirichlet", []))
+
+    return tuple(bool(window) for window in data["windows"])
+
+
+# Solves problems that share their geometry, the matrix is factorized only once
+# Heater and temperature changes are back-solves, window changes are low rank updates,
+# or factorizations of their own when those are cheaper
+def solveGroup(problems):
+    solved = []
+
+    # The most common window pattern is factorized
+    patterns = [fixedPattern(data) for _, data in problems]
+    common = max(set(patterns), key=patterns.count)
+    commonData = problems[patterns.index(common)][1]
+
+    factorization = None
+    for base, data in problems:
+        h = data.get("h", DEFAULT_H)
+
+        # Problems that were already solved are taken from the cache
+        if CACHE is not None:
+            key = CACHE.key(data, h, solverSettings({}))
+            u = CACHE.get(key)
+            if u is not None:
+                solved += [saveSolution(base, u, h, data)]
+                continue
+
+        A, b, shape = assemble(data, h)
+
+        pattern = fixedPattern(data)
+        if factorization is None:
+            factorization = lsv.CachedFactorization(assemble(commonData, h)[0])
+
+        if pattern == common:
+            x = factorization.solve(b)
         else:
-            print("Point (" + str(i) + ", " + str(j) + ") missed!")
-            print("Associated point index is " + str(k))
-            raise Exception()
+            x = factorization.solve(b, A, key=pattern)
+
+        u = toGrid(x, shape)
+        if CACHE is not None:
+            CACHE.put(key, u, h, extents(data), data)
 
+        solved += [saveSolution(base, u, h, data)]
 
-# Solving the system
-print("Solving the problem...")
-x = spsolve(csc_matrix(A), b)
+    return solved
 
-# Solution in the 2d discrete domain
-u = np.zeros((nh, nv))
 
-for k in range(0, N):
-    i, j = getIJ(k)
-    u[i, j] = x[k]
+# Solves all the problems of a directory or a .jsonl file using a pool of processes
+def batch(path, workers):
+    problems = loadProblems(path)
 
-# Setting up the visualization (optional)
-if False:
-    fig, ax = mpl.subplots(1,1)
-    pcm = ax.pcolormesh(u.T, cmap='RdBu_r')
-    fig.colorbar(pcm)
-    ax.set_xlabel('x')
-    ax.set_ylabel('y')
-    ax.set_title('Laplace equation solution.')
-    ax.set_aspect('equal', 'datalim')
+    groups = {}
+    for base, data in problems:
+        groups.setdefault(geometryKey(data), []).append((base, data))
 
-    mpl.show()
+    # Each group is split so all the workers have something to do,
+    # keeping the problems with the same windows together
+    tasks = []
+    for group in groups.values():
+        group.sort(key=lambda problem: fixedPattern(problem[1]))
+        size = -(-len(group) // max(1, workers // len(groups)))
+        tasks += [group[i:i + size] for i in range(0, len(group), size)]
 
-# Saving the matrix
-solution_name = name[:name.index(".")] + '_solution.npy'
-with open(solution_name, 'wb') as solution:
-    np.save(solution, u)
+    start = time.perf_counter()
+    cacheSettings = (CACHE.directory, CACHE.maxSize) if CACHE is not None else (None, 0)
+    with Pool(workers, initializer=setCache, initargs=cacheSettings) as pool:
+        solved = [name for names in pool.map(solveGroup, tasks) for name in names]
 
-print("Problem solved, solution stored in: " + solution_name)
\ No newline at end of file
+    print("{} problems solved in {:.2f} s, {} geometries, {} tasks".format(
+        len(solved), time.perf_counter() - start, len(groups), len(tasks)))
+
+    return solved
+
+
+if __name__ == "__main__":
+
+    # Loads a .json file that setups the problem
+    if len(sys.argv) <= 1:
+        print("Invalid setup data.")
+        sys.exit()
+
+    name = sys.argv[1]
+
+    # Storing the solutions in single precision or compressed, the latter can't be memory-mapped
+    if "--float32" in sys.argv:
+        STORAGE["dtype"] = np.float32
+    STORAGE["compress"] = "--compress" in sys.argv
+
+    # Solutions are cached between runs, unless --no-cache is given
+    if "--no-cache" not in sys.argv:
+        cacheDirectory = os.path.join(os.path.expanduser("~"), ".hotel-solver-cache")
+        setCache(getOption("--cache", cacheDirectory), int(float(getOption("--cache-size", 1024)) * 2**20))
+
+    # Solving many problems, given as a directory or a .jsonl file
+    if "--batch" in sys.argv:
+        batch(name, int(getOption("--workers", os.cpu_count())))
+        sys.exit()
+
+    # Timing the phases of the run and measuring its memory, stored as base_profile.json
+    if "--profile" in sys.argv:
+        PROFILE = profiler.Profile()
+
+    with phase("load"):
+        with open(name) as j:
+            data = json.load(j)
+
+    # Precision, the distance between the points of the grid
+    h = data.get("h", DEFAULT_H)
+    if PROFILE is not None:
+        PROFILE.set("h", h)
+
+    # Method used to solve the system, a 3D problem is too big for the direct solver
+    threeDimensional = "depth" in domain.problemDomain(data)
+
+    options = {
+        "solver": getOption("--solver", "bicgstab" if threeDimensional else "direct"),
+        "precond": getOption("--precond", "mg"),
+        "tol": float(getOption("--tol", 1e-8)),
+        "maxiter": int(getOption("--maxiter", 1000))}
+
+    if options["solver"] == "cg":
+        print("Error: " + lsv.UNSYMMETRIC + ".")
+        sys.exit(1)
+
+    if options["solver"] not in lsv.SOLVERS or options["precond"] not in lsv.PRECONDITIONERS:
+        print("Available solvers:", ", ".join(lsv.SOLVERS))
+        print("Available preconditioners:", ", ".join(lsv.PRECONDITIONERS))
+        sys.exit()
+
+    # A stored solution of the same problem is up to date, unless --force is given
+    try:
+        header = sf.readHeader(name[:name.index(".")] + '_solution.sol')
+        upToDate = header["hash"] == sf.problemHash(data) and header["h"] == h
+    except (OSError, ValueError):
+        upToDate = False
+
+    if upToDate and not any(flag in sys.argv for flag in ["--force", "--refine", "--incremental", "--transient"]):
+        print("The stored solution is up to date: " + name[:name.index(".")] + '_solution.sol')
+        sys.exit()
+
+    # Evolving the temperatures in time, from the steady state of the problem given after
+    # --initial, or from the stored solution of this one
+    if "--transient" in sys.argv:
+        method = getOption("--method", "euler")
+        if method not in TIME_METHODS:
+            print("Available methods:", ", ".join(TIME_METHODS))
+            sys.exit()
+
+        if "--initial" in sys.argv:
+            with open(getOption("--initial")) as j:
+                initial = solve(json.load(j), h, **options)
+        else:
+            previous = loadSolution(name[:name.index(".")])
+            if previous is None:
+                print("There is no stored solution to start from, use --initial.")
+                sys.exit()
+            initial = previous[0]
+
+        print("Evolving the problem...")
+        frames_name = transient(data, h, name[:name.index(".")], initial,
+                                int(getOption("--steps", 100)), float(getOption("--dt", 0.05)), method,
+                                float(getOption("--diffusivity", 1.0)), int(getOption("--every", 1)), **options)
+        print("Problem evolved, frames stored in: " + frames_name)
+        saveProfile(name[:name.index(".")])
+        sys.exit()
+
+    # Solving the system
+    if "--refine" in sys.argv:
+        levels = int(getOption("--levels", 3))
+        tolerance = float(getOption("--tolerance", 0.01))
+
+        print("Refining the problem...")
+        u, h = refine(data, h, levels, tolerance, **options)
+    elif "--incremental" in sys.argv:
+        print("Solving the problem from its previous solution...")
+        u = resolve(data, h, name[:name.index(".")], **options)
+    else:
+        print("Solving the problem...")
+        u = solve(data, h, **options)
+
+    # Setting up the visualization (optional)
+    if False:
+        fig, ax = mpl.subplots(1,1)
+        pcm = ax.pcolormesh(u.T, cmap='RdBu_r')
+        fig.colorbar(pcm)
+        ax.set_xlabel('x')
+        ax.set_ylabel('y')
+        ax.set_title('Laplace equation solution.')
+        ax.set_aspect('equal', 'datalim')
+
+        mpl.show()
+
+    # Saving the matrix
+    solution_name = saveSolution(name[:name.index(".")], u, h, data)
+    print("Problem solved, solution stored in: " + solution_name)
+    saveProfile(name[:name.index(".")])
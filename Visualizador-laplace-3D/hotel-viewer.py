@@ -4,53 +4,110 @@ Alexander Cuevas, CC3501, 2020-1
 Visualizes the solution of a Laplace equation in a 3D space
 """
 
+import os
+import sys
+
+# The render mode draws without a window, PyOpenGL must then use a software
+# context, OSMesa unless PYOPENGL_PLATFORM says otherwise, chosen before it is imported
+RENDER = "--render" in sys.argv
+if RENDER:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "osmesa")
+
 import glfw
 from OpenGL.GL import *
 import OpenGL.GL.shaders
 import numpy as np
 import json
-import sys
 
 import transformations as tr
 import basic_shapes as bs
 import easy_shaders as es
 import scene_graph as sg
 import lighting_shaders as ls
-
-# Import that helps to get the contours
-import matplotlib.pyplot as mpl
+import solution_file as sf
+import domain
+import colormap as cm
+import arrows as ar
+import contours as ct
 
 
-# Loads a .json file that setups the problem
+# Loads a .json file that setups the problem, or with --render
+# a .json file that lists the scenes to render
 if len(sys.argv) <= 1:
     print("Invalid setup data.")
     sys.exit()
 
 name = sys.argv[1]
 
-with open(name) as j:
-    data = json.load(j)
+# With --frames, the frames of the evolution in time are loaded instead of the solution
+FRAMES = "--frames" in sys.argv
 
-# Loads the .npy file that solves that problem
-solution_name = name[:name.index(".")] + '_solution.npy'
+# Number of level curves at the start, evenly spaced between the minimal and maximal values
+CURVES = int(sys.argv[sys.argv.index("--levels") + 1]) if "--levels" in sys.argv[:-1] else 10
 
-try:
-    with open(solution_name) as s:
-        print('\n' + "Loading solution...", end = ' ')
-except:
-    print('\n' + "Solution not found.")
-    sys.exit()
+# Time between the frames in the playback
+PLAYBACK_DT = 0.1
+
+
+# Loads a problem and the .sol file that solves it, its values are memory-mapped
+# The shapes are built from the problem loaded, the slice shown at the start
+# is the closest to height, or the lowest one
+def loadProblem(problemName, frames=False, height=None):
+    global data, header, values
+    global PRECISION, minval, maxval, midval
+    global X_MIN, X_MAX, Y_MIN, Y_MAX, problemDomain, HOTEL
+    global FRAME_COUNT, FRAME_DT, LAYERS, startLayer
+
+    with open(problemName) as j:
+        data = json.load(j)
+
+    solution_name = problemName[:problemName.index(".")] + ('_frames.sol' if frames else '_solution.sol')
+    header, solution = sf.openSolution(solution_name)
+
+    if header["hash"] != sf.problemHash(data):
+        print('\n' + "Warning: the solution is stale, the problem changed after it was solved.")
 
-solution = np.load(solution_name)
-shapeSol = solution.shape
+    # Precision of the solution
+    PRECISION = header["h"]
 
-# Precision of the solution
-PRECISION = 0.1
+    # Checks minimal and maximal values for the heat map
+    minval = header["min"]
+    maxval = header["max"]
+    midval = (maxval + minval) / 2
 
-# Checks minimal and maximal values for the heat map
-minval = np.min(solution[np.nonzero(solution)])
-maxval = np.max(solution)
-midval = (maxval + minval) / 2
+    # Limits of the domain, and its walls and conditions
+    (X_MIN, X_MAX), (Y_MIN, Y_MAX) = header["extents"][:2]
+    problemDomain = domain.problemDomain(data)
+
+    # The hotel of five rooms is drawn in detail, any other domain is drawn from its walls
+    HOTEL = "domain" not in data and len(data["windows"]) == 5
+
+    # The values are a sequence of frames, a single one unless they are loaded,
+    # only the frame shown is read from the file
+    values = solution if frames else solution[np.newaxis]
+    FRAME_COUNT = values.shape[0]
+
+    # Time between the frames, in the time of the problem
+    FRAME_DT = header.get("dt", 0)
+
+    # A 3D solution is shown as horizontal slices
+    LAYERS = values.shape[3] if values.ndim == 4 else 1
+
+    if height is not None:
+        startLayer = min(max(int(round(height / PRECISION)), 0), LAYERS - 1)
+    else:
+        startLayer = 0
+
+    selectSlice(0, startLayer)
+
+
+# Shows the slice of the solution at a frame and a layer, the functions that
+# build the floor, the curves and the arrows use the slice
+def selectSlice(frame, layer):
+    global solution, shapeSol
+
+    solution = values[frame, :, :, layer] if values.ndim == 4 else values[frame]
+    shapeSol = solution.shape
 
 
 # Class that stores the application control
@@ -58,14 +115,31 @@ class Controller:
     def __init__(self):
         self.cameraPhi = np.pi / 2
         self.cameraTheta = np.pi / 4
-        self.xPos = data["L"] / 2
-        self.yPos = data["P"] / 2
+        self.xPos = data["L"] / 2 if "domain" not in data else (X_MIN + X_MAX) / 2
+        self.yPos = data["P"] / 2 if "domain" not in data else (Y_MIN + Y_MAX) / 2
         self.curves = False
         self.arrows = False
+        self.layer = startLayer
+        self.frame = 0
+        self.playing = False
+        self.colormap = 0
+        self.rangeScale = 1.0
+        self.curveCount = CURVES
+        self.curveShift = 0.0
+
+
+# The problem given is loaded at the start, in the render mode each scene loads its own
+if not RENDER:
+    try:
+        print('\n' + "Loading solution...", end = ' ')
+        loadProblem(name, FRAMES, float(sys.argv[sys.argv.index("--height") + 1]) if "--height" in sys.argv[:-1] else None)
+    except (OSError, ValueError):
+        print('\n' + "Solution not found.")
+        sys.exit()
 
-
-# Global controller that communicates with the callback function
-controller = Controller()
+# Global controller that communicates with the callback function,
+# in the render mode there is a new one for each scene
+controller = None if RENDER else Controller()
 
 
 # Helps to control the camera by snapping it to these degrees
@@ -95,16 +169,9 @@ def on_key(window, key, scancode, action, mods):
         controller.xPos += 0.1 * sign * np.cos(controller.cameraTheta)
         controller.yPos += 0.1 * sign * np.sin(controller.cameraTheta)
 
-        # Limits the movement to the interior of the hotel
-        if controller.xPos < 0:
-            controller.xPos = 0
-        elif controller.xPos > 5 * data["L"] + 4 * data["W"]:
-            controller.xPos = 5 * data["L"] + 4 * data["W"]
-        
-        if controller.yPos < 0:
-            controller.yPos = 0
-        elif controller.yPos > data["P"] + data["W"] + data["D"]:
-            controller.yPos = data["P"] + data["W"] + data["D"]
+        # Limits the movement to the interior of the domain
+        controller.xPos = min(max(controller.xPos, X_MIN), X_MAX)
+        controller.yPos = min(max(controller.yPos, Y_MIN), Y_MAX)
     
     elif key == glfw.KEY_RIGHT:
         controller.cameraTheta = (controller.cameraTheta - np.pi / 90) % (2 * np.pi)
@@ -129,35 +196,73 @@ def on_key(window, key, scancode, action, mods):
     elif key == glfw.KEY_RIGHT_CONTROL:
         controller.arrows = not controller.arrows
 
+    # Moving the slice of a 3D solution up and down
+    elif key == glfw.KEY_PAGE_UP:
+        controller.layer = min(controller.layer + 1, LAYERS - 1)
+
+    elif key == glfw.KEY_PAGE_DOWN:
+        controller.layer = max(controller.layer - 1, 0)
+
+    # Playing the frames, or moving through them one at a time
+    elif key == glfw.KEY_P:
+        controller.playing = not controller.playing
+        if controller.frame == FRAME_COUNT - 1:
+            controller.frame = 0
+
+    elif key == glfw.KEY_PERIOD:
+        controller.frame = min(controller.frame + 1, FRAME_COUNT - 1)
+
+    elif key == glfw.KEY_COMMA:
+        controller.frame = max(controller.frame - 1, 0)
+
+    # Changing the colormap and its range, only the uniforms of the floor change
+    elif key == glfw.KEY_C:
+        controller.colormap = (controller.colormap + 1) % len(COLORMAP_NAMES)
+        print("Colormap:", COLORMAP_NAMES[controller.colormap])
+
+    elif key == glfw.KEY_MINUS:
+        controller.rangeScale *= 0.8
+        print("Range: {:.2f} to {:.2f}".format(colorRange()[0], colorRange()[2]))
+
+    elif key == glfw.KEY_EQUAL:
+        controller.rangeScale /= 0.8
+        print("Range: {:.2f} to {:.2f}".format(colorRange()[0], colorRange()[2]))
+
+    elif key == glfw.KEY_R:
+        controller.rangeScale = 1.0
+        print("Range: {:.2f} to {:.2f}".format(colorRange()[0], colorRange()[2]))
+
+    # Adding and removing level curves, and shifting them by a quarter of their spacing
+    elif key == glfw.KEY_RIGHT_BRACKET:
+        controller.curveCount += 1
+
+    elif key == glfw.KEY_LEFT_BRACKET:
+        controller.curveCount = max(controller.curveCount - 1, 1)
+
+    elif key == glfw.KEY_APOSTROPHE:
+        controller.curveShift = (controller.curveShift + 0.25) % 1
+
+    elif key == glfw.KEY_SEMICOLON:
+        controller.curveShift = (controller.curveShift - 0.25) % 1
+
     elif key == glfw.KEY_ESCAPE:
         sys.exit()
 
 
-# Colorates the heat map with 3 colors
-def colorMap(i, j):
+# Colormaps that can be chosen, the first one is the three-color ramp blue, white, red
+COLORMAP_NAMES = list(cm.COLORMAPS)
 
-    # Getting the temperature
-    x = min(int(i / PRECISION + 0.0001), shapeSol[0] - 1)
-    y = min(int(j / PRECISION + 0.0001), shapeSol[1] - 1)
 
-    return colorAux(solution[x, y])
+# Minimum, intermediate and maximum values of the colormap, the range
+# may be narrowed or widened around the intermediate value
+def colorRange():
+    half = (maxval - minval) / 2 * controller.rangeScale
+    return midval - half, midval, midval + half
 
 
 # Returns the appropiate color for a temperature
 def colorAux(temperature):
-    colorMin = np.array([0, 0, 1])
-    colorMid = np.array([1, 1, 1])
-    colorMax = np.array([1, 0, 0])
-
-    # Assigning the colors
-    if temperature <= minval:
-        return list(colorMin)
-    elif minval < temperature < midval:
-        ratio = (temperature - minval) / (midval - minval)
-        return list(colorMin * (1 - ratio) + colorMid * ratio)
-    else:
-        ratio = (temperature - midval) / (maxval - midval)
-        return list(colorMid * (1 - ratio) + colorMax * ratio)
+    return list(cm.colors(temperature, COLORMAP_NAMES[controller.colormap], *colorRange()))
 
 
 # Returns a list of the key points of the geometry
@@ -213,49 +318,51 @@ def keyPoints():
     return pts
 
 
-# Shape of the floor
+# Shape of the floor, built as arrays, its vertices are all the positions
+# followed by all the temperatures, that are colored by the shader
 def createFloor():
-    global data
 
     # Generate a terrain with many samples between the limits of the map
-    xs = np.ogrid[0:5 * data["L"] + 4 * data["W"]:np.complex(shapeSol[0], 1)]
-    ys = np.ogrid[0:data["P"] + data["W"] + data["D"]:np.complex(shapeSol[1], 1)]
+    xs = np.linspace(X_MIN, X_MAX, shapeSol[0])
+    ys = np.linspace(Y_MIN, Y_MAX, shapeSol[1])
 
     xSize = len(xs)
     ySize = len(ys)
 
-    # Defining the location and colors of each vertex of the shape
-    vertices = []
-    indices = []
+    # Each vertex has a position x, y, 0
+    X, Y = np.meshgrid(xs, ys, indexing="ij")
 
-    # Generating a vertex for each sample x, y, and assigning a color
-    for i in range(xSize):
-        for j in range(ySize):
-            x = xs[i]
-            y = ys[j]
+    positions = np.zeros((xSize, ySize, 3), dtype=np.float32)
+    positions[:, :, 0] = X
+    positions[:, :, 1] = Y
 
-            vertices += [x, y, 0] + colorMap(x, y)
+    # The vertices are generated by full columns j-y and then move to
+    # the next i-x. Hence, the index for each vertex i,j is i * ySize + j
+    index = np.arange(xSize * ySize, dtype=np.uint32).reshape(xSize, ySize)
 
-    # The previous loops generates full columns j-y and then move to
-    # the next i-x. Hence, the index for each vertex i,j can be computed as
-    index = lambda i, j: i * len(ys) + j 
-    
     # We generate quads for each cell connecting 4 neighbor vertices
-    for i in range(len(xs) - 1):
-        for j in range(len(ys) - 1):
+    isw = index[:-1, :-1]
+    ise = index[1:, :-1]
+    ine = index[1:, 1:]
+    inw = index[:-1, 1:]
 
-            # Getting indices for all vertices in this quad
-            isw = index(i,j)
-            ise = index(i+1,j)
-            ine = index(i+1,j+1)
-            inw = index(i,j+1)
+    # Adding each cell's quad as 2 triangles
+    indices = np.stack([isw, ise, ine, ine, inw, isw], axis=-1)
 
-            # Adding this cell's quad as 2 triangles
-            indices += [
-                isw, ise, ine,
-                ine, inw, isw]
+    vertices = np.concatenate([positions.ravel(), floorTemperatures()])
 
-    return bs.Shape(vertices, indices)
+    return bs.Shape(vertices, indices.ravel())
+
+
+# Temperatures of the vertices of the floor, taken from the point of the solution below them
+def floorTemperatures():
+    xs = np.linspace(X_MIN, X_MAX, shapeSol[0])
+    ys = np.linspace(Y_MIN, Y_MAX, shapeSol[1])
+
+    xIndex = np.minimum((xs / PRECISION + 0.0001).astype(int), shapeSol[0] - 1)
+    yIndex = np.minimum((ys / PRECISION + 0.0001).astype(int), shapeSol[1] - 1)
+
+    return np.asarray(solution, dtype=np.float32)[np.ix_(xIndex, yIndex)].ravel()
 
 
 # Shape of the roof
@@ -264,8 +371,8 @@ def createRoof():
     # Defining the location and colors of each vertex of the shape
     vertices = []
 
-    pts = keyPoints()
-    for vertex in [pts[0], pts[3], pts[24], pts[33]]:
+    corners = [[X_MIN, Y_MIN, 0], [X_MAX, Y_MIN, 0], [X_MIN, Y_MAX, 0], [X_MAX, Y_MAX, 0]]
+    for vertex in corners:
         vertices += vertex + [0.75, 0.75, 0.75] + [0, 0, -1]
 
     # Defining connections among vertices
@@ -274,82 +381,72 @@ def createRoof():
     return bs.Shape(vertices, indices)
 
 
-# Shape of a curve
-def createCurve(curve, level):
-
-    z = (level - minval) / (maxval - minval)
-    color = list((np.array(colorAux(level)) + np.array([1, 1, 1])) * 0.5)
-
-    # Defining the location and colors of each vertex of the shape
-    vertices = []
-
-    # This shape is meant to be drawn with GL_LINES
-    indices = []
-
-    for i, pos in enumerate(curve):
-        vertices += [pos[0] * PRECISION, pos[1] * PRECISION, z] + color
-        indices += [i, i + 1]
-
-    indices.pop()
-
-    return bs.Shape(vertices, indices)
-
-
-# Calculate the gradient of a point
-def calculateGradient(i, j):
-
-    zUp = solution[i - 1, j] if i > 0 else solution[i, j]
-    zDown = solution[i + 1, j] if i < shapeSol[0] - 1 else solution[i, j]
-    zLeft = solution[i, j - 1] if j > 0 else solution[i, j]
-    zRight = solution[i, j + 1] if j < shapeSol[1] - 1 else solution[i, j]
-
-    # Calculating the derivatives by approximation
-    x = (zDown - zUp) / (2 * PRECISION)
-    y = (zRight - zLeft) / (2 * PRECISION)
+# Levels of the curves, evenly spaced between the minimal and maximal values and
+# shifted by a fraction of their spacing, without reaching those values
+def curveLevels():
+    spacing = (maxval - minval) / (controller.curveCount + 1)
+    return [minval + spacing * (k + controller.curveShift) for k in range(1, controller.curveCount + 1)]
 
-    # Returns the vertex value (normalized) and its magnitude
-    vertex = np.array([x, y, 0.0])
-    normalized = vertex / np.linalg.norm(vertex)
 
-    magnitude = min(1, np.sqrt(x**2 + y**2))
+# Vertices of the curve of a level, 6 floats each, meant to be drawn with GL_LINES
+# The segments are given as an array n x 2 x 2 of points i,j
+def curveVertices(segments, level):
 
-    return (normalized, magnitude)
-
-
-# Shape of the arrow map
-def createArrowMap():
+    z = (level - minval) / (maxval - minval)
+    color = (np.array(colorAux(level)) + np.array([1, 1, 1])) * 0.5
 
     # Defining the location and colors of each vertex of the shape
-    vertices = []
-
-    # This shape is meant to be drawn with GL_LINES
-    indices = []
+    vertices = np.zeros((len(segments) * 2, 6), dtype=np.float32)
+    vertices[:, :2] = segments.reshape(-1, 2) * PRECISION
+    vertices[:, 2] = z
+    vertices[:, 3:] = color
 
-    for i in range(shapeSol[0]):
-        for j in range(shapeSol[1]):
-            k = j + i * shapeSol[0]
+    return vertices
 
-            color = [0, 0, 0]
 
-            # Getting the gradient
-            gradient, magnitude = calculateGradient(i, j)
-            vertex = np.array([i * PRECISION, j * PRECISION, 0.05])
-            end_point = vertex + 0.07 * magnitude * gradient
-
-            middle = (vertex + end_point) / 2
-
-            # Creating the arrowhead
-            perpendicular = np.cross(end_point - vertex, [0, 0, 1])
-            perpendicular /= np.linalg.norm(perpendicular)
-
-            # Adding the arrow
-            vertices += list(vertex) + color + list(end_point) + color
-            vertices += list(middle + 0.02 * magnitude * perpendicular) + color
-            vertices += list(middle - 0.02 * magnitude * perpendicular) + color
-
-            indices += [4 * k, 4 * k + 1, 4 * k + 1, 4 * k + 2, 4 * k + 1, 4 * k + 3]
-
-    return bs.Shape(vertices, indices)
+# Level curves of the slice shown, all of them in a single buffer where each level is a
+# range of vertices, so they are drawn in one call and changing them is one buffer update
+# The indices are fixed to 0, 1, 2... so only the vertices change
+class CurveBuffer:
+    def __init__(self):
+        self.gpuShape = None
+        self.capacity = 0
+        self.starts = []
+        self.counts = []
+
+    # Extracts the curves of the levels from the slice shown and replaces the buffer
+    def update(self, levels):
+
+        # Getting the contours, the walls (stored as 0) are left out
+        values = np.asarray(solution, dtype=float)
+        segments = ct.contourSegments(values, levels, values == 0)
+
+        vertices = [curveVertices(curve, level) for curve, level in zip(segments, levels)]
+        self.counts = [len(curve) for curve in vertices]
+        self.starts = list(np.cumsum([0] + self.counts[:-1]))
+        vertices = np.concatenate(vertices) if vertices else np.zeros((0, 6), dtype=np.float32)
+
+        # The buffer only grows, with room to spare
+        if len(vertices) > self.capacity:
+            self.clear()
+            self.capacity = 2 * len(vertices)
+            data = np.zeros((self.capacity, 6), dtype=np.float32)
+            data[:len(vertices)] = vertices
+            self.gpuShape = es.toGPUShape(bs.Shape(data.ravel(), np.arange(self.capacity, dtype=np.uint32)))
+        elif len(vertices) > 0:
+            glBindBuffer(GL_ARRAY_BUFFER, self.gpuShape.vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, 0, vertices.nbytes, vertices)
+
+    def clear(self):
+        if self.gpuShape is not None:
+            es.clearGPUShape(self.gpuShape)
+        self.gpuShape = None
+        self.capacity = 0
+
+    # Draws the curves of all the levels in a single call
+    def draw(self, pipeline):
+        if self.gpuShape is not None:
+            pipeline.drawShapeRanges(self.gpuShape, self.starts, self.counts, GL_LINES)
 
 
 # Shape of the walls
@@ -423,6 +520,67 @@ def createWalls():
     return bs.Shape(vertices, indices)
 
 
+# Shape of the walls of any domain, each wall is a box clipped to the domain,
+# the open windows (dirichlet) are drawn as glass and the fluxes in red or blue
+def createDomainWalls():
+
+    # Defining the location and colors of each vertex of the shape
+    vertices = []
+    color = [0.75, 0.75, 0.75]
+
+    # Adds a vertical face from x0, y0 to x1, y1 between the heights z0 and z1
+    def face(x0, y0, x1, y1, faceColor, z0=0, z1=1):
+        nonlocal vertices
+        normal = [y1 - y0, x0 - x1, 0]
+        vertices += [x0, y0, z0] + faceColor + normal + [x0, y0, z1] + faceColor + normal
+        vertices += [x1, y1, z0] + faceColor + normal + [x1, y1, z1] + faceColor + normal
+
+    # The border of the domain, facing inwards
+    face(X_MIN, Y_MIN, X_MAX, Y_MIN, color)
+    face(X_MAX, Y_MIN, X_MAX, Y_MAX, color)
+    face(X_MAX, Y_MAX, X_MIN, Y_MAX, color)
+    face(X_MIN, Y_MAX, X_MIN, Y_MIN, color)
+
+    # The walls, facing outwards
+    for x0, y0, x1, y1 in problemDomain["walls"]:
+        x0, x1 = max(x0, X_MIN), min(x1, X_MAX)
+        y0, y1 = max(y0, Y_MIN), min(y1, Y_MAX)
+        if x0 >= x1 or y0 >= y1:
+            continue
+
+        face(x0, y0, x0, y1, color)
+        face(x0, y1, x1, y1, color)
+        face(x1, y1, x1, y0, color)
+        face(x1, y0, x0, y0, color)
+
+    # The conditions over segments are drawn slightly in front of the border
+    # In 3D a segment [x0, y0, x1, y1, value, z0, z1] only covers the heights z0 to z1,
+    # the walls being as high as the depth of the domain
+    depth = problemDomain.get("depth", 1)
+
+    def segment(condition, segmentColor):
+        x0, y0, x1, y1 = condition[:4]
+        z0, z1 = condition[5:7] if len(condition) > 5 else (0.3 * depth, depth)
+
+        dx = 0.01 if x0 == x1 == X_MIN else -0.01 if x0 == x1 == X_MAX else 0
+        dy = 0.01 if y0 == y1 == Y_MIN else -0.01 if y0 == y1 == Y_MAX else 0
+        face(x0 + dx, y0 + dy, x1 + dx, y1 + dy, segmentColor, z0 / depth, z1 / depth)
+
+    for condition in problemDomain.get("dirichlet", []):
+        segment(condition, [0.5, 0.5, 1])
+
+    for condition in problemDomain.get("neumann", []):
+        segment(condition, [1, 0, 0] if condition[4] > 0 else [1, 1, 0])
+
+    # Defining connections among vertices
+    indices = []
+
+    for i in range(0, len(vertices) // 9, 4):
+        indices += [i + 1, i, i + 2, i + 1, i + 2, i + 3]
+
+    return bs.Shape(vertices, indices)
+
+
 # Moves the camera in a spherical system,
 # returns the view matrix and the viewPos vector for later use
 def moveCamera():
@@ -441,129 +599,126 @@ def moveCamera():
     return tr.lookAt(viewPos, np.array([atX, atY, atZ]), viewUp), viewPos
 
 
-# Get the contours from matplotlib
-def get_contour_verts(cn):
-    contours = []
-
-    # For each contour line
-    for cc in cn.collections:
-        paths = []
-
-        # For each separate section of the contour line
-        for pp in cc.get_paths():
-            xy = []
-            # for each segment of that section
-            for vv in pp.iter_segments():
-                xy.append(vv[0])
-            paths.append(np.vstack(xy))
-        contours.append(paths)
-
-    return contours
-
-
-# Main function
-if __name__ == "__main__":
-
-    # Initialize glfw
-    if not glfw.init():
-        sys.exit()
-
-    width = 600
-    height = 600
-
-    window = glfw.create_window(width, height, "Heat map inside Don Pedro's hotel.", None, None)
+# Shader programs and the lookup tables of the colormaps, created once
+# for a GL context and shared by all the scenes drawn on it
+class Pipelines:
+    def __init__(self):
+        #self.lighting = ls.SimpleFlatShaderProgram()
+        #self.lighting = ls.SimpleGouraudShaderProgram()
+        self.lighting = ls.SimplePhongShaderProgram()
+        self.simple = es.SimpleModelViewProjectionShaderProgram()
+        self.colormap = cm.ColormapShaderProgram()
 
-    if not window:
-        glfw.terminate()
-        sys.exit()
+        # A lookup table for each colormap, switching them only binds another texture
+        self.textures = [cm.createTexture(colormapName) for colormapName in COLORMAP_NAMES]
 
-    glfw.make_context_current(window)
+        # Setting up the clear screen color
+        glClearColor(0.85, 0.85, 0.85, 1.0)
 
-    # Connecting the callback function 'on_key' to handle keyboard events
-    glfw.set_key_callback(window, on_key)
+        # As we work in 3D, we need to check which part is in front,
+        # and which one is at the back
+        glEnable(GL_DEPTH_TEST)
 
-    # Defining shader programs
-    #pipeline = ls.SimpleFlatShaderProgram()
-    #pipeline = ls.SimpleGouraudShaderProgram()
-    pipeline = ls.SimplePhongShaderProgram()
-    simplePipeline = es.SimpleModelViewProjectionShaderProgram()
+        # Filling the shapes
+        glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
 
-    glUseProgram(pipeline.shaderProgram)
 
-    # Setting up the clear screen color
-    glClearColor(0.85, 0.85, 0.85, 1.0)
+# Shapes of the problem loaded on the GPU
+class Scene:
+    def __init__(self):
 
-    # As we work in 3D, we need to check which part is in front,
-    # and which one is at the back
-    glEnable(GL_DEPTH_TEST)
+        # Creating the graphs
+        self.roofGraph = sg.SceneGraphNode("roof")
+        self.roofGraph.transform = tr.translate(0, 0, 1)
+        self.roofGraph.childs += [es.toGPUShape(createRoof())]
 
-    # Filling the shapes
-    glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+        self.wallGraph = sg.SceneGraphNode("wall")
+        self.wallGraph.childs += [es.toGPUShape(createWalls() if HOTEL else createDomainWalls())]
 
-    # Getting the contours
-    x, y = np.mgrid[:shapeSol[0], :shapeSol[1]]
-    cnt = mpl.contour(x, y, solution, 12)
+        self.floorGraph = sg.SceneGraphNode("floor")
+        self.floorGraph.childs += [cm.toGPUShape(createFloor())]
 
-    cnt_list = get_contour_verts(cnt)[1:11]
-    cnt_levels = cnt.levels[1:11]
+        # The curves and arrows are built when they are shown, and again after the slice
+        # or the colormap changes; the floor only receives the new temperatures
+        self.curveBuffer = CurveBuffer()
+        self.curvesState = None
+        self.arrowPyramid = None
+        self.arrowGpus = None
 
-    # Creating the graphs
-    roofGraph = sg.SceneGraphNode("roof")
-    roofGraph.transform = tr.translate(0, 0, 1)
-    roofGraph.childs += [es.toGPUShape(createRoof())]
+        self.shown = (controller.frame, controller.layer)
 
-    floorGraph = sg.SceneGraphNode("floor")
-    floorGraph.childs += [es.toGPUShape(createFloor())]
+        # Light position
+        self.lgX = (X_MIN + X_MAX) / 2
+        self.lgY = Y_MIN + 2 * (Y_MAX - Y_MIN)
 
-    wallGraph = sg.SceneGraphNode("wall")
-    wallGraph.childs += [es.toGPUShape(createWalls())]
+    # Replaces the temperatures of the floor when another slice is chosen,
+    # returns whether it changed
+    def updateSlice(self):
+        if (controller.frame, controller.layer) == self.shown:
+            return False
 
-    curvesGpu = []
-    for contour, level in zip(cnt_list, cnt_levels):
-        curvesGpu.append(es.toGPUShape(createCurve(contour[0], level)))
-    
-    arrowGpu = es.toGPUShape(createArrowMap())
+        selectSlice(controller.frame, controller.layer)
+        cm.updateValues(self.floorGraph.childs[0], floorTemperatures())
 
-    # Setting up the projection
-    projection = tr.perspective(60, float(width) / float(height), 0.1, 100)
+        self.clearArrows()
+        self.curvesState = None
+        self.shown = (controller.frame, controller.layer)
 
-    # Light position
-    lgX = 2.5 * data["L"] + 2 * data["W"]
-    lgY = 2 * (data["P"] + data["W"] + data["D"])
+        return True
 
-    print("Solution loaded." + '\n')
-    print("Minimum value (Blue):", "{:.2f}".format(minval))
-    print("Intermediate value (White):", "{:.2f}".format(midval))
-    print("Maximum value (Red):", "{:.2f}".format(maxval), '\n')
-    print("You can move with the arrow keys and tilt the view with the W and S keys" + '\n')
+    def clearArrows(self):
+        for gpuShape in self.arrowGpus or []:
+            es.clearGPUShape(gpuShape)
+        self.arrowGpus = None
 
-    while not glfw.window_should_close(window):
-        # Using GLFW to check for input events
-        glfw.poll_events()
+    # Frees the GPU memory of the scene, the pipelines are kept
+    def clear(self):
+        for graph in [self.roofGraph, self.wallGraph, self.floorGraph]:
+            es.clearGPUShape(graph.childs[0])
+        self.curveBuffer.clear()
+        self.clearArrows()
 
-        # Moving the camera
-        view, viewPos = moveCamera()
+    def draw(self, pipelines, view, viewPos, projection):
 
         # Clearing the screen in both, color and depth
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        # The floor and curves are drawn without light effects
+        # The floor and curves are drawn without light effects, the floor is colored by the shader
+        colormapPipeline = pipelines.colormap
+        glUseProgram(colormapPipeline.shaderProgram)
+        glUniformMatrix4fv(glGetUniformLocation(colormapPipeline.shaderProgram, "projection"), 1, GL_TRUE, projection)
+        glUniformMatrix4fv(glGetUniformLocation(colormapPipeline.shaderProgram, "view"), 1, GL_TRUE, view)
+        colormapPipeline.setColormap(pipelines.textures[controller.colormap], *colorRange())
+        sg.drawSceneGraphNode(self.floorGraph, colormapPipeline, "model")
+
+        simplePipeline = pipelines.simple
         glUseProgram(simplePipeline.shaderProgram)
         glUniformMatrix4fv(glGetUniformLocation(simplePipeline.shaderProgram, "projection"), 1, GL_TRUE, projection)
         glUniformMatrix4fv(glGetUniformLocation(simplePipeline.shaderProgram, "view"), 1, GL_TRUE, view)
         glUniformMatrix4fv(glGetUniformLocation(simplePipeline.shaderProgram, "model"), 1, GL_TRUE, tr.identity())
-        sg.drawSceneGraphNode(floorGraph, simplePipeline, "model")
 
-        # Drawing the curves
+        # Drawing the curves, their colors follow the colormap; they are extracted
+        # again when the slice, the levels or the colormap change
         if controller.curves:
-            for curve in curvesGpu:
-                simplePipeline.drawShape(curve, GL_LINES)
-        
-        # Drawing the arrows
+            state = (controller.colormap, controller.rangeScale, controller.curveCount, controller.curveShift)
+            if self.curvesState != state:
+                self.curveBuffer.update(curveLevels())
+                self.curvesState = state
+
+            self.curveBuffer.draw(simplePipeline)
+
+        # Drawing the arrows, only the tiles in view, at the level of detail of their distance
         if controller.arrows:
-            simplePipeline.drawShape(arrowGpu, GL_LINES)
+            if self.arrowGpus is None:
+                self.arrowPyramid = ar.ArrowPyramid(solution, PRECISION)
+                self.arrowGpus = [es.toGPUShape(shape) for shape in self.arrowPyramid.shapes]
+
+            ranges = self.arrowPyramid.visibleRanges(viewPos, np.matmul(projection, view))
+            for arrowGpu, (starts, counts) in zip(self.arrowGpus, ranges):
+                simplePipeline.drawShapeRanges(arrowGpu, starts, counts, GL_LINES)
 
         # Using the lighting shader program
+        pipeline = pipelines.lighting
         glUseProgram(pipeline.shaderProgram)
         glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "La"), 1.0, 1.0, 1.0)
         glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "Ld"), 1.0, 1.0, 1.0)
@@ -573,7 +728,7 @@ if __name__ == "__main__":
         glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "Kd"), 0.4, 0.4, 0.4)
         glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "Ks"), 0.4, 0.4, 0.4)
 
-        glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "lightPosition"), lgX, lgY, 0.5)
+        glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "lightPosition"), self.lgX, self.lgY, 0.5)
         glUniform3f(glGetUniformLocation(pipeline.shaderProgram, "viewPosition"), viewPos[0], viewPos[1], viewPos[2])
         glUniform1ui(glGetUniformLocation(pipeline.shaderProgram, "shininess"), 10)
         glUniform1f(glGetUniformLocation(pipeline.shaderProgram, "constantAttenuation"), 0.001)
@@ -585,10 +740,149 @@ if __name__ == "__main__":
         glUniformMatrix4fv(glGetUniformLocation(pipeline.shaderProgram, "model"), 1, GL_TRUE, tr.identity())
 
         # Drawing the graphs
-        sg.drawSceneGraphNode(wallGraph, pipeline, "model")
-        sg.drawSceneGraphNode(roofGraph, pipeline, "model")
+        sg.drawSceneGraphNode(self.wallGraph, pipeline, "model")
+        sg.drawSceneGraphNode(self.roofGraph, pipeline, "model")
+
+
+# Renders the scenes listed in a .json file into images, without a window
+#   "width", "height": size of the images, 600 x 600 by default
+#   "cameras": poses {"name", "x", "y", "theta", "phi"}, shared by the scenes;
+#              a pose without x or y starts where the viewer does
+#   "scenes": {"problem", "output", "cameras", "frame", "height", "curves", "arrows",
+#              "colormap", "levels"}, only "problem" is needed; "output" may use {problem}
+#              and {camera}, and "cameras" replaces the shared ones for that scene
+# The context and the pipelines are created once, each scene only loads its shapes
+def renderScenes(renderName):
+    global controller
+
+    import offscreen
+
+    with open(renderName) as j:
+        spec = json.load(j)
+
+    width = spec.get("width", 600)
+    height = spec.get("height", 600)
+
+    # The context is kept alive until all the scenes are rendered
+    context = offscreen.createContext(width, height)
+    framebuffer = offscreen.Framebuffer(width, height)
+    pipelines = Pipelines()
+
+    projection = tr.perspective(60, float(width) / float(height), 0.1, 100)
+
+    rendered = 0
+    for sceneSpec in spec["scenes"]:
+        problemName = sceneSpec["problem"]
+
+        try:
+            loadProblem(problemName, "frame" in sceneSpec, sceneSpec.get("height"))
+        except (OSError, ValueError):
+            print("Solution not found:", problemName)
+            continue
+
+        controller = Controller()
+        controller.frame = min(sceneSpec.get("frame", 0), FRAME_COUNT - 1)
+        controller.curves = sceneSpec.get("curves", False)
+        controller.arrows = sceneSpec.get("arrows", False)
+        controller.colormap = COLORMAP_NAMES.index(sceneSpec.get("colormap", COLORMAP_NAMES[0]))
+        controller.curveCount = sceneSpec.get("levels", CURVES)
+        start = (controller.xPos, controller.yPos)
+
+        selectSlice(controller.frame, controller.layer)
+        scene = Scene()
+
+        problemBase = os.path.splitext(os.path.basename(problemName))[0]
+        output = sceneSpec.get("output", "{problem}_{camera}.png")
+
+        for camera in sceneSpec.get("cameras", spec.get("cameras", [{"name": "view"}])):
+            controller.xPos = camera.get("x", start[0])
+            controller.yPos = camera.get("y", start[1])
+            controller.cameraTheta = camera.get("theta", np.pi / 4)
+            controller.cameraPhi = camera.get("phi", np.pi / 2)
+
+            view, viewPos = moveCamera()
+            scene.draw(pipelines, view, viewPos, projection)
+
+            imageName = output.format(problem=problemBase, camera=camera.get("name", "view"))
+            framebuffer.save(imageName)
+            rendered += 1
+            print("Rendered", imageName)
+
+        scene.clear()
+
+    print(rendered, "images rendered")
+
+
+# Main function
+if __name__ == "__main__" and RENDER:
+    renderScenes(name)
+
+elif __name__ == "__main__":
+
+    # Initialize glfw
+    if not glfw.init():
+        sys.exit()
+
+    width = 600
+    height = 600
+
+    window = glfw.create_window(width, height, "Heat map inside Don Pedro's hotel.", None, None)
+
+    if not window:
+        glfw.terminate()
+        sys.exit()
+
+    glfw.make_context_current(window)
+
+    # Connecting the callback function 'on_key' to handle keyboard events
+    glfw.set_key_callback(window, on_key)
+
+    # Defining shader programs and creating the shapes
+    pipelines = Pipelines()
+    scene = Scene()
+
+    lastFrameTime = glfw.get_time()
+
+    # Setting up the projection
+    projection = tr.perspective(60, float(width) / float(height), 0.1, 100)
+
+    print("Solution loaded." + '\n')
+    print("Minimum value (Blue):", "{:.2f}".format(minval))
+    print("Intermediate value (White):", "{:.2f}".format(midval))
+    print("Maximum value (Red):", "{:.2f}".format(maxval), '\n')
+    print("You can move with the arrow keys and tilt the view with the W and S keys")
+    print("C changes the colormap, - and = narrow and widen its range and R restores it")
+    print("[ and ] remove and add level curves, ; and ' shift them" + '\n')
+
+    if LAYERS > 1:
+        print("The solution is 3D, Page Up and Page Down move the slice shown on the floor")
+        print("Slice at height {:.2f}".format(controller.layer * PRECISION), '\n')
+
+    if FRAME_COUNT > 1:
+        print(FRAME_COUNT, "frames, P plays them and the comma and period keys move through them" + '\n')
+
+    while not glfw.window_should_close(window):
+        # Using GLFW to check for input events
+        glfw.poll_events()
+
+        # Advancing the frames while playing, it stops at the last one
+        if controller.playing and glfw.get_time() - lastFrameTime >= PLAYBACK_DT:
+            lastFrameTime = glfw.get_time()
+            controller.frame = min(controller.frame + 1, FRAME_COUNT - 1)
+            controller.playing = controller.frame < FRAME_COUNT - 1
+
+        shown = scene.shown
+        if scene.updateSlice():
+            if controller.layer != shown[1]:
+                print("Slice at height {:.2f}".format(controller.layer * PRECISION))
+            if controller.frame != shown[0]:
+                print("Frame {}, time {:.2f}".format(controller.frame, controller.frame * FRAME_DT))
+
+        # Moving the camera and drawing
+        view, viewPos = moveCamera()
+        scene.draw(pipelines, view, viewPos, projection)
 
         # Once the drawing is rendered, buffers are swap so an uncomplete drawing is never seen.
         glfw.swap_buffers(window)
 
-    glfw.terminate()
\ No newline at end of file
+    glfw.terminate()
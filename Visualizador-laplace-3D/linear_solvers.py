@@ -0,0 +1,363 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Direct and iterative solvers for the sparse systems of the Laplace equation
+"""
+
+import itertools
+import numpy as np
+import os
+import time
+
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import splu, spilu, spsolve_triangular, LinearOperator
+from scipy.sparse.linalg import bicgstab, gmres
+
+
+# Names accepted by solveSystem
+SOLVERS = ["direct", "bicgstab", "gmres", "mg"]
+PRECONDITIONERS = ["none", "jacobi", "ilu", "mg"]
+
+KRYLOV = {"bicgstab": bicgstab, "gmres": gmres}
+
+# Conjugate gradients is not offered, it needs a symmetric matrix and the mirrored neighbors
+# of the Neumann borders make this one unsymmetric; halving the border rows isn't enough,
+# as the rows next to the end of a wall still differ from their columns
+UNSYMMETRIC = "cg needs a symmetric matrix, but the Neumann borders make this one unsymmetric, use bicgstab or gmres"
+
+
+# Interpolation from a grid of (n + 1) // 2 points per axis to the grid of the given shape,
+# whose points are numbered as in Multigrid, the coarse points are its even points
+# Along each axis, an odd point averages its two coarse neighbors weighted by its coefficients
+# towards them in A, so nothing is interpolated across a wall, where that coefficient is 0
+# (otherwise, once the walls are too thin for the coarser grids, the corrections of a
+# room would leak into the next one and the cycles would barely converge)
+def prolongation(A, shape):
+    N = int(np.prod(shape))
+    k = np.arange(N)
+    coarseShape = tuple((n + 1) // 2 for n in shape)
+
+    # Coarse neighbors of each point along each axis, below and above it, with their weights
+    axes = []
+    stride = 1
+    coarseStride = 1
+    for n, nc in zip(shape, coarseShape):
+        i = k // stride % n
+        odd = i % 2 == 1
+
+        below = np.zeros(N)
+        above = np.zeros(N)
+        below[stride:] = np.abs(A.diagonal(-stride))
+        above[:N - stride] = np.abs(A.diagonal(stride))
+        above[i == n - 1] = 0
+
+        total = below + above
+        weightBelow = np.where(odd, np.divide(below, total, out=np.zeros(N), where=total != 0), 1.0)
+        weightAbove = np.where(odd, np.divide(above, total, out=np.zeros(N), where=total != 0), 0.0)
+
+        lower = i // 2
+        upper = np.minimum(lower + 1, nc - 1)
+        axes += [[(lower * coarseStride, weightBelow), (upper * coarseStride, weightAbove)]]
+
+        stride *= n
+        coarseStride *= nc
+
+    rows, cols, vals = [], [], []
+    for corner in itertools.product(*axes):
+        col = sum(c for c, _ in corner)
+        weight = np.prod([w for _, w in corner], axis=0)
+
+        nonzero = weight != 0
+        rows += [k[nonzero]]
+        cols += [col[nonzero]]
+        vals += [weight[nonzero]]
+
+    return csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(N, int(np.prod(coarseShape))))
+
+
+# Geometric multigrid over a structured grid of nh x nv points, where k = j * nh + i,
+# or of nh x nv x nd points, where k = l * nh * nv + j * nh + i
+# The coarse operators are built as R A P, so the boundary conditions carry over
+class Multigrid:
+    def __init__(self, A, shape, smoothing=3, omega=0.8, coarsest=2000):
+        self.smoothing = smoothing
+        self.omega = omega
+
+        self.As = [csr_matrix(A)]
+        self.Ps = []
+
+        shape = tuple(shape)
+        while np.prod(shape) > coarsest and min(shape) > 3:
+            M = self.As[-1]
+
+            # Points with a fixed value (walls and open windows) are not interpolated,
+            # the coarse corrections would change their values
+            free = (np.diff(M.indptr) > 1).astype(float)
+            P = csr_matrix(diags(free) @ prolongation(M, shape))
+
+            # Coarse points that ended up without connections keep an identity row
+            Ac = csr_matrix(P.T @ M @ P)
+            Ac = csr_matrix(Ac + diags((Ac.diagonal() == 0).astype(float)))
+
+            self.Ps += [P]
+            self.As += [Ac]
+            shape = tuple((n + 1) // 2 for n in shape)
+
+        self.invDiagonals = [1 / M.diagonal() for M in self.As]
+        self.coarseLU = splu(self.As[-1].tocsc())
+
+    # Number of grids used, the finest one included
+    def levels(self):
+        return len(self.As)
+
+    # Approximates the solution of As[level] x = b with one V-cycle
+    def cycle(self, b, level=0, x=None):
+        if level == len(self.As) - 1:
+            return self.coarseLU.solve(b)
+
+        A = self.As[level]
+        invDiagonal = self.invDiagonals[level]
+        x = np.zeros_like(b) if x is None else x
+
+        # Damped Jacobi before and after the coarse correction
+        for _ in range(self.smoothing):
+            x = x + self.omega * invDiagonal * (b - A @ x)
+
+        P = self.Ps[level]
+        x = x + P @ self.cycle(P.T @ (b - A @ x), level + 1)
+
+        for _ in range(self.smoothing):
+            x = x + self.omega * invDiagonal * (b - A @ x)
+
+        return x
+
+    def asPreconditioner(self):
+        return LinearOperator(self.As[0].shape, matvec=self.cycle)
+
+
+# Factorization of a matrix A that is reused to solve many right sides, and also
+# systems whose matrix differs from A in a few rows (as when a window is toggled)
+# The latter use the Sherman-Morrison-Woodbury formula when it is cheaper than
+# a new factorization, which is only the case when very few rows change
+# stored gives the factors and the times of a factorization loaded by loadFactorization
+# The columns are ordered by minimum degree on A^T + A, which gives about half the fill
+# of the default ordering on the grids of the problems, so the factors are cheaper to keep
+class CachedFactorization:
+    ORDERING = "MMD_AT_PLUS_A"
+
+    def __init__(self, A, maxUpdates=2, stored=None):
+        self.A = csr_matrix(A)
+
+        if stored is not None:
+            self.lu, self.factorizationTime, self.solveTime = stored
+        else:
+            start = time.perf_counter()
+            self.lu = splu(self.A.tocsc(), permc_spec=self.ORDERING)
+            self.factorizationTime = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.lu.solve(np.ones(self.A.shape[0]))
+            self.solveTime = time.perf_counter() - start
+
+        # Size of the factors, a low rank update can't take more memory than them
+        self.factorsSize = self.lu.L.nnz + self.lu.U.nnz
+
+        # Updates (or factorizations) of the last matrices used, by key, the oldest
+        # ones are dropped as each one can take as much memory as the factorization
+        self.maxUpdates = maxUpdates
+        self.updates = {}
+
+    # Difference A2 - A, and the rows where it isn't zero
+    def difference(self, A2):
+        D = csr_matrix(A2 - self.A)
+        D.eliminate_zeros()
+        return D, np.unique(D.nonzero()[0])
+
+    # Whether a low rank update of the factorization solves A2 x = b for less than
+    # a new factorization of A2: the update solves the factorization once per
+    # changed row, and keeps a dense matrix of N x rank
+    def updatable(self, A2, rows=None):
+        rank = len(self.difference(A2)[1] if rows is None else rows)
+        return rank * self.solveTime <= self.factorizationTime and rank * self.A.shape[0] <= self.factorsSize
+
+    # Builds a function that solves A2 x = b, using a low rank update of the factorization
+    # of A when its cost is lower than the cost of a new factorization of A2
+    def update(self, A2):
+        D, rows = self.difference(A2)
+        rank = len(rows)
+
+        if rank == 0:
+            return self.lu.solve
+
+        if not self.updatable(A2, rows):
+            return splu(csr_matrix(A2).tocsc(), permc_spec=self.ORDERING).solve
+
+        # A2 = A + U V, where U has the columns of the identity at the changed rows
+        V = D[rows]
+        U = np.zeros((self.A.shape[0], rank))
+        U[rows, np.arange(rank)] = 1
+
+        Z = self.lu.solve(U)
+        capacitance = lu_factor(np.eye(rank) + V @ Z)
+
+        def solve(b):
+            y = self.lu.solve(b)
+            return y - Z @ lu_solve(capacitance, V @ y)
+
+        return solve
+
+    # Solves A x = b, or A2 x = b when A2 is given
+    # key identifies A2, so its update is only computed once while it is kept
+    def solve(self, b, A2=None, key=None):
+        if A2 is None:
+            return self.lu.solve(b)
+
+        if key is None or key not in self.updates:
+            while len(self.updates) >= self.maxUpdates:
+                del self.updates[next(iter(self.updates))]
+            self.updates[key] = self.update(A2)
+
+        return self.updates[key](b)
+
+    # Stores the matrix, its factors and their times in a .npz file, so another run
+    # can solve systems with them without factorizing the matrix again
+    def save(self, path):
+        L = csr_matrix(self.lu.L)
+        U = csr_matrix(self.lu.U)
+
+        arrays = {"perm_r": self.lu.perm_r, "perm_c": self.lu.perm_c,
+                  "times": np.array([self.factorizationTime, self.solveTime])}
+        for name, M in [("A", self.A), ("L", L), ("U", U)]:
+            arrays.update({name + "_data": M.data, name + "_indices": M.indices, name + "_indptr": M.indptr})
+
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+
+# Factors of a matrix loaded from a file, solved as the SuperLU object of splu,
+# where Pr A Pc = L U, so x = Pc U^-1 L^-1 Pr b; b may have several columns
+class StoredLU:
+    def __init__(self, L, U, perm_r, perm_c):
+        self.L = L
+        self.U = U
+        self.perm_r = perm_r
+        self.perm_c = perm_c
+
+    def solve(self, b):
+        permuted = np.empty_like(b, dtype=float)
+        permuted[self.perm_r] = b
+
+        y = spsolve_triangular(self.L, permuted, lower=True, unit_diagonal=True)
+        z = spsolve_triangular(self.U, y, lower=False)
+        return z[self.perm_c]
+
+
+# Loads a factorization stored by CachedFactorization.save, None if there is none
+# Its factorization time is the one measured when it was made, but a solve is timed again,
+# as the triangular solves of the stored factors are several times slower than SuperLU
+# and the cost of its updates would be underestimated with the stored time
+def loadFactorization(path, maxUpdates=2):
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as arrays:
+        n = len(arrays["perm_r"])
+        A, L, U = [csr_matrix((arrays[name + "_data"], arrays[name + "_indices"], arrays[name + "_indptr"]),
+                              shape=(n, n)) for name in ["A", "L", "U"]]
+
+        lu = StoredLU(L, U, arrays["perm_r"], arrays["perm_c"])
+        factorizationTime = arrays["times"][0]
+
+    start = time.perf_counter()
+    lu.solve(np.ones(n))
+    solveTime = time.perf_counter() - start
+
+    return CachedFactorization(A, maxUpdates, stored=(lu, factorizationTime, solveTime))
+
+
+# Builds the preconditioner M of a Krylov method
+def preconditioner(A, name, shape=None):
+    if name == "none":
+        return None
+
+    if name == "jacobi":
+        return diags(1 / A.diagonal())
+
+    if name == "ilu":
+        ilu = spilu(A.tocsc(), drop_tol=1e-4, fill_factor=10)
+        return LinearOperator(A.shape, matvec=ilu.solve)
+
+    if name == "mg":
+        return Multigrid(A, shape).asPreconditioner()
+
+    raise ValueError("Unknown preconditioner: " + name)
+
+
+# Solves A x = b, returns x and a report with the iterations, residual and time,
+# the setup being the part of the time spent factorizing or building the preconditioner
+# shape is the grid nh x nv (x nd), only needed by the multigrid method
+# M is a preconditioner already built for A, to reuse it between systems with the same matrix
+def solveSystem(A, b, solver="direct", precond="mg", tol=1e-8, maxiter=1000, x0=None, shape=None, M=None):
+    start = time.perf_counter()
+    iterations = 0
+    setup = 0.0
+
+    if solver == "direct":
+        factorization = splu(A.tocsc())
+        setup = time.perf_counter() - start
+        x = factorization.solve(b)
+
+    elif solver == "mg":
+        multigrid = Multigrid(A, shape)
+        setup = time.perf_counter() - start
+        x = np.zeros_like(b) if x0 is None else np.copy(x0)
+        bNorm = np.linalg.norm(b)
+
+        converged = np.linalg.norm(b - A @ x) <= tol * bNorm
+        while iterations < maxiter and not converged:
+            x = multigrid.cycle(b, x=x)
+            iterations += 1
+            converged = np.linalg.norm(b - A @ x) <= tol * bNorm
+
+        if not converged:
+            print("Warning:", solver, "didn't converge after", iterations, "iterations.")
+
+    elif solver in KRYLOV:
+        if M is None:
+            M = preconditioner(A, precond, shape)
+        setup = time.perf_counter() - start
+
+        def count(_):
+            nonlocal iterations
+            iterations += 1
+
+        kwargs = {"callback_type": "pr_norm"} if solver == "gmres" else {}
+
+        # Older versions of scipy call the relative tolerance tol
+        try:
+            x, info = KRYLOV[solver](A, b, x0=x0, rtol=tol, maxiter=maxiter, M=M, callback=count, **kwargs)
+        except TypeError:
+            x, info = KRYLOV[solver](A, b, x0=x0, tol=tol, maxiter=maxiter, M=M, callback=count, **kwargs)
+
+        if info > 0:
+            print("Warning:", solver, "didn't converge after", iterations, "iterations.")
+
+    elif solver == "cg":
+        raise ValueError(UNSYMMETRIC)
+
+    else:
+        raise ValueError("Unknown solver: " + solver)
+
+    elapsed = time.perf_counter() - start
+    residual = np.linalg.norm(b - A @ x) / max(np.linalg.norm(b), 1e-300)
+
+    report = {
+        "solver": solver,
+        "preconditioner": precond if solver in KRYLOV else "none",
+        "iterations": iterations,
+        "residual": float(residual),
+        "time": elapsed,
+        "setup": setup}
+
+    return x, report
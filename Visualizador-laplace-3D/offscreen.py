@@ -0,0 +1,104 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Drawing without a window, on a software context of OSMesa or EGL
+and into a framebuffer object that is read back as an image
+"""
+
+import os
+import ctypes
+from OpenGL.GL import *
+from OpenGL import arrays
+import numpy as np
+from PIL import Image
+
+
+# Platforms of PyOpenGL that can create a context without a display
+PLATFORMS = ["osmesa", "egl"]
+
+
+# Creates a context of the platform chosen by PYOPENGL_PLATFORM, which must be
+# set before OpenGL is imported, and makes it current; returns what must be kept alive
+def createContext(width, height):
+    platform = os.environ.get("PYOPENGL_PLATFORM")
+
+    if platform == "osmesa":
+        from OpenGL import osmesa
+
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not context:
+            raise RuntimeError("OSMesa could not create a context.")
+
+        # OSMesa needs a buffer of its own, though the drawing goes to the framebuffer object
+        buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(context, buffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("OSMesa could not make the context current.")
+
+        return context, buffer
+
+    if platform == "egl":
+        from OpenGL import EGL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = ctypes.c_long(), ctypes.c_long()
+        if not EGL.eglInitialize(display, major, minor):
+            raise RuntimeError("EGL could not be initialized.")
+
+        attributes = arrays.GLintArray.asArray([
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_NONE])
+        configs = (EGL.EGLConfig * 1)()
+        count = ctypes.c_long()
+        if not EGL.eglChooseConfig(display, attributes, configs, 1, count) or count.value == 0:
+            raise RuntimeError("EGL has no configuration for OpenGL.")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context = EGL.eglCreateContext(display, configs[0], EGL.EGL_NO_CONTEXT, None)
+
+        # The context has no surface, it only draws into framebuffer objects
+        if not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context):
+            raise RuntimeError("EGL could not make the context current.")
+
+        return display, context
+
+    raise RuntimeError("PYOPENGL_PLATFORM must be one of: " + ", ".join(PLATFORMS))
+
+
+# Framebuffer object of width x height with color and depth, it stays bound
+# so everything drawn afterwards goes into it
+class Framebuffer:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+        self.color, self.depth = glGenRenderbuffers(2)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("The framebuffer object is incomplete.")
+
+        glViewport(0, 0, width, height)
+
+    # Pixels drawn, as an array height x width x 3 with the top row first
+    def read(self):
+        glFinish()
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+
+        image = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return image[::-1]
+
+    def save(self, path):
+        Image.fromarray(self.read()).save(path)
@@ -0,0 +1,85 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Profile of a run split in phases, with their time and the peak memory
+of the process, stored as .json to compare versions
+"""
+
+import json
+import platform
+import sys
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+import scipy
+
+# The peak memory is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Peak resident memory of the process until now in MB, None where it is unknown
+def peakRSS():
+    if resource is None:
+        return None
+
+    # Linux gives it in KB and macOS in bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+# Versions of the libraries and the platform, results are only comparable on the same ones
+def environment():
+    return {
+        "versions": {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__},
+        "platform": platform.platform()}
+
+
+# Phases in the order they ran, a phase that runs several times accumulates its time
+# The peak memory of a phase is the one of the process when it ended, so the phase
+# where it grows is the one that raised it
+class Profile:
+    def __init__(self):
+        self.phases = {}
+        self.values = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # Adds the time of a phase measured elsewhere
+    def record(self, name, seconds):
+        phase = self.phases.setdefault(name, {"time": 0.0, "calls": 0})
+        phase["time"] += seconds
+        phase["calls"] += 1
+        phase["peak_rss_mb"] = peakRSS()
+
+    # Stores a value of the run, such as the size of the matrix
+    def set(self, name, value):
+        self.values[name] = value
+
+    def report(self):
+        return dict({
+            "phases": self.phases,
+            "total": time.perf_counter() - self.start,
+            "peak_rss_mb": peakRSS(),
+            "values": self.values}, **environment())
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self):
+        lines = ["{:<14} {:>9.3f} s".format(name, phase["time"]) for name, phase in self.phases.items()]
+        if peakRSS() is not None:
+            lines += ["Peak memory {:.1f} MB".format(peakRSS())]
+        return "\n".join(lines)
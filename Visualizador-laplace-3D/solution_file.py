@@ -0,0 +1,160 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Solution files of the Laplace equation, a JSON header with the metadata
+followed by the raw values, so they can be memory-mapped
+"""
+
+import numpy as np
+import hashlib
+import json
+import zlib
+
+
+# Every solution file starts with these bytes, followed by the length of the header
+MAGIC = b"LAPSOL01"
+
+# The values start at a multiple of this, so they can be mapped efficiently
+ALIGNMENT = 64
+
+# Percentiles stored in the header
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+# Room left in the header of a file of frames, for the statistics written at the end
+FRAME_HEADER_ROOM = 1024
+
+
+# Hash of a problem, it doesn't depend on the formatting of its .json file
+def problemHash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+# Minimum, maximum and percentiles of a solution, the walls (stored as 0) are ignored
+def statistics(u):
+    values = u[np.nonzero(u)]
+    if len(values) == 0:
+        values = np.zeros(1)
+
+    return {
+        "min": float(np.min(values)),
+        "max": float(np.max(values)),
+        "percentiles": dict(zip(map(str, PERCENTILES), map(float, np.percentile(values, PERCENTILES))))}
+
+
+# Magic bytes, length and header of a solution file, the header is padded so it
+# takes length bytes, or so the values start at a multiple of ALIGNMENT
+def headerBytes(header, length=None):
+    encoded = json.dumps(header).encode()
+
+    if length is None:
+        length = len(encoded) + (-(len(MAGIC) + 8 + len(encoded)) % ALIGNMENT)
+
+    if len(encoded) > length:
+        raise ValueError("The header doesn't fit in " + str(length) + " bytes.")
+
+    return MAGIC + length.to_bytes(8, "little") + encoded + b" " * (length - len(encoded))
+
+
+# Writes a solution u with a grid spacing h, extents are the limits of the domain
+# dtype may be float32 to halve the size, compress trades memory-mapping for size
+def writeSolution(path, u, h, extents, data=None, dtype=np.float64, compress=False):
+    values = np.ascontiguousarray(u, dtype=dtype)
+    raw = values.tobytes()
+
+    header = {
+        "shape": list(values.shape),
+        "dtype": np.dtype(dtype).name,
+        "h": h,
+        "extents": extents,
+        "hash": problemHash(data) if data is not None else None,
+        "compression": "zlib" if compress else None,
+        "problem": data}
+    header.update(statistics(u))
+
+    if compress:
+        raw = zlib.compress(raw)
+        header["size"] = len(raw)
+
+    with open(path, "wb") as solution:
+        solution.write(headerBytes(header))
+        solution.write(raw)
+
+
+# Reads only the header of a solution file, without touching its values
+def readHeader(path):
+    with open(path, "rb") as solution:
+        if solution.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a solution file.")
+
+        length = int.from_bytes(solution.read(8), "little")
+        header = json.loads(solution.read(length).decode())
+
+    header["offset"] = len(MAGIC) + 8 + length
+    return header
+
+
+# Opens a solution file, returns its header and its values
+# The values are memory-mapped, unless the file is compressed
+def openSolution(path, mode="r"):
+    header = readHeader(path)
+    shape = tuple(header["shape"])
+
+    if header["compression"] == "zlib":
+        with open(path, "rb") as solution:
+            solution.seek(header["offset"])
+            raw = zlib.decompress(solution.read(header["size"]))
+        return header, np.frombuffer(raw, dtype=header["dtype"]).reshape(shape)
+
+    return header, np.memmap(path, dtype=header["dtype"], mode=mode, offset=header["offset"], shape=shape)
+
+
+# Writes a sequence of solutions over the same grid one frame at a time, as a solution
+# file whose first axis is the frame; each frame is a contiguous chunk of the file,
+# so neither the writer nor a reader that maps it have to keep all of them in memory
+class FrameWriter:
+    def __init__(self, path, frames, shape, h, extents, data=None, dtype=np.float64, **metadata):
+        self.path = path
+
+        self.header = {
+            "shape": [frames] + list(shape),
+            "dtype": np.dtype(dtype).name,
+            "h": h,
+            "extents": extents,
+            "hash": problemHash(data) if data is not None else None,
+            "compression": None,
+            "problem": data,
+            "frames": frames,
+            "min": None,
+            "max": None,
+            "percentiles": None}
+        self.header.update(metadata)
+
+        # The header is written now, leaving room for the statistics of the frames
+        encoded = json.dumps(self.header).encode()
+        self.length = len(encoded) + FRAME_HEADER_ROOM
+        self.length += -(len(MAGIC) + 8 + self.length) % ALIGNMENT
+        offset = len(MAGIC) + 8 + self.length
+
+        with open(path, "wb") as solution:
+            solution.write(headerBytes(self.header, self.length))
+            solution.truncate(offset + int(np.prod(self.header["shape"])) * np.dtype(dtype).itemsize)
+
+        self.values = np.memmap(path, dtype=dtype, mode="r+", offset=offset, shape=tuple(self.header["shape"]))
+
+    # Stores the frame at an index
+    def write(self, index, u):
+        self.values[index] = u
+
+        frame = statistics(u)
+        if self.header["min"] is not None:
+            frame["min"] = min(frame["min"], self.header["min"])
+            frame["max"] = max(frame["max"], self.header["max"])
+        self.header["min"], self.header["max"] = frame["min"], frame["max"]
+
+    # Flushes the frames and writes the statistics over all of them
+    def close(self):
+        self.values.flush()
+        del self.values
+
+        with open(self.path, "r+b") as solution:
+            solution.write(headerBytes(self.header, self.length))
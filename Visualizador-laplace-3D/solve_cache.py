@@ -0,0 +1,89 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+On-disk cache of solutions, addressed by a hash of the problem and the way it was solved
+"""
+
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+
+import solution_file as sf
+
+
+# Keys of a problem that don't change its solution
+IGNORED_KEYS = ["filename"]
+
+
+# A directory of .sol files named by their key, the least recently used
+# files are removed when the directory grows beyond maxSize bytes
+# Several processes may share the same directory
+class SolveCache:
+    def __init__(self, directory, maxSize=2**30):
+        self.directory = directory
+        self.maxSize = maxSize
+        os.makedirs(directory, exist_ok=True)
+
+    # Key of a problem solved with a grid spacing h and the given solver settings
+    def key(self, data, h, settings):
+        problem = {key: value for key, value in data.items() if key not in IGNORED_KEYS}
+        content = json.dumps({"problem": problem, "h": h, "settings": settings}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".sol")
+
+    # Returns the solution stored with a key, or None if there is none
+    def get(self, key):
+        try:
+            _, u = sf.openSolution(self.path(key))
+            u = np.array(u)
+
+            # Marking the entry as recently used
+            os.utime(self.path(key))
+            return u
+        except (OSError, ValueError):
+            return None
+
+    # Stores a solution, the file is written aside and then renamed,
+    # so other processes never see it half written
+    def put(self, key, u, h, extents, data):
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(handle)
+
+        try:
+            sf.writeSolution(temporary, u, h, extents, data)
+            os.replace(temporary, self.path(key))
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+
+        self.evict()
+
+    # Removes the least recently used entries until the cache fits in maxSize
+    def evict(self):
+        entries = []
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(".sol"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, fileName))
+                    entries += [(stat.st_mtime, stat.st_size, fileName)]
+                except OSError:
+                    pass
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, fileName in sorted(entries):
+            if total <= self.maxSize:
+                break
+
+            # Another process may have removed it already
+            try:
+                os.remove(os.path.join(self.directory, fileName))
+            except OSError:
+                pass
+
+            total -= size
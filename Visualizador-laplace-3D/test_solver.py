@@ -0,0 +1,74 @@
+# coding=utf-8
+"""
+Alexander Cuevas, CC3501, 2020-1
+Tests of hotel-solver.py and linear_solvers.py, run with pytest
+"""
+
+import importlib.util
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import linear_solvers as lsv
+
+
+# The solver is a script with a dash in its name, it is loaded as a module
+HERE = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location("hotel_solver", os.path.join(HERE, "hotel-solver.py"))
+solver = importlib.util.module_from_spec(spec)
+sys.modules["hotel_solver"] = solver
+spec.loader.exec_module(solver)
+
+with open(os.path.join(HERE, "test.json")) as f:
+    TEST = json.load(f)
+
+
+# The refinement measures the solves, even when their solutions are in the cache
+def test_refine_does_not_use_the_cache(tmp_path, capsys):
+    solver.setCache(str(tmp_path), 2**30)
+    try:
+        for h in [0.1, 0.05]:
+            solver.solve(TEST, h)
+
+        for _ in range(2):
+            capsys.readouterr()
+            solver.refine(TEST, 0.1, 2, 0)
+
+            times = [float(t) for t in re.findall(r"unknowns, ([\d.]+) s", capsys.readouterr().out)]
+            assert len(times) == 2
+            assert all(t >= 0.01 for t in times)
+    finally:
+        solver.setCache(None, 0)
+
+
+# The multigrid cycles converge by themselves, in spite of the rooms closed by walls
+def test_multigrid_converges(capsys):
+    A, b, shape = solver.assemble(TEST, 0.05)
+    x, report = lsv.solveSystem(A, b, solver="mg", shape=shape)
+
+    assert report["iterations"] < 50
+    assert report["residual"] < 1e-8
+    assert "Warning" not in capsys.readouterr().out
+
+
+# Running out of cycles is reported, as with the Krylov solvers
+def test_multigrid_warns_without_convergence(capsys):
+    A, b, shape = solver.assemble(TEST, 0.05)
+    x, report = lsv.solveSystem(A, b, solver="mg", shape=shape, maxiter=2)
+
+    assert report["iterations"] == 2
+    assert "Warning: mg didn't converge after 2 iterations." in capsys.readouterr().out
+
+
+# A factorization loaded from a file is solved slower than by SuperLU, so it takes the
+# cost of its updates from its own solves and factorizes again where a fresh one wouldn't
+def test_loaded_factorization_refactorizes(tmp_path):
+    A, b, shape = solver.assemble(TEST, 0.025)
+    path = str(tmp_path / "factors.npz")
+    lsv.CachedFactorization(A).save(path)
+
+    factorization = lsv.loadFactorization(path)
+    assert not factorization.updatable(A, rows=np.arange(30))